@@ -0,0 +1,164 @@
+# Benchmarks the render of the demo animation and the examples
+#
+# Frames are piped to a process that discards them instead of ffmpeg, and the
+# time of every script (and of every section of the demo) is split between
+# animation, serialization, rasterization and pipe writes.
+#
+#   python benchmark.py [-o raw=True -o workers=4] [--json results.json] [scripts]
+
+import os
+import io
+import sys
+import ast
+import json
+import time
+import runpy
+import argparse
+import tempfile
+import contextlib
+
+from prosvg import svg, geometry, render
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+SCRIPTS = [
+    'demo-anim.py',
+    'examples/circle-animation.py',
+    'examples/epicycloids.py',
+    'examples/parametric-animation.py',
+    'examples/text-animation.py'
+]
+
+# Functions timed for each phase
+PHASES = {
+    'animation': (geometry.Animation, 'evaluate'),
+    'serialization': (svg.Drawing, 'byteString'),
+    'rasterization': (render.Render, 'getRaster'),
+    'pipe': (render.Output, 'pipe')
+}
+
+timers = dict.fromkeys(PHASES, 0)
+renders = []  # Render objects created by the current script
+sections = {} # Open outputs, with a snapshot of when they started
+results = []
+
+def timed(phase, function):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            timers[phase] += time.perf_counter() - start
+    return wrapper
+
+def snapshot(frames):
+    return (time.perf_counter(), frames, dict(timers))
+
+def measure(script, section, start, frames):
+    seconds = time.perf_counter() - start[0]
+    frames -= start[1]
+    phases = {phase: timers[phase] - start[2][phase] for phase in PHASES}
+    phases['other'] = seconds - sum(phases.values())
+    return {
+        'script': script,
+        'section': section,
+        'frames': frames,
+        'seconds': seconds,
+        'fps': frames / seconds if seconds > 0 else 0,
+        'phases': phases
+    }
+
+def instrument(options):
+    for phase, (owner, name) in PHASES.items():
+        setattr(owner, name, timed(phase, getattr(owner, name)))
+
+    init = render.Render.__init__
+    def __init__(self, *args, **kwargs):
+        kwargs.update(options)
+        init(self, *args, **kwargs)
+        renders.append(self)
+    render.Render.__init__ = __init__
+
+    start = render.Render.start
+    def startSection(self, filename, *args, **kwargs):
+        sections[filename] = (self, snapshot(self.frames))
+        start(self, filename, *args, **kwargs)
+    render.Render.start = startSection
+
+    end = render.Render.end
+    def endSection(self, filename=None):
+        end(self, filename)
+        names = [filename] if filename is not None else list(sections)
+        for name in names:
+            if name in sections:
+                video, start = sections.pop(name)
+                results.append(measure(currentScript, name, start, video.frames))
+    render.Render.end = endSection
+
+def run(script):
+    global currentScript
+    currentScript = script
+    path = os.path.join(ROOT, script)
+    renders.clear()
+    sections.clear()
+    first = len(results)
+
+    directory = os.getcwd()
+    sys.path.insert(0, os.path.dirname(path))
+    with tempfile.TemporaryDirectory() as output:
+        os.makedirs(os.path.join(output, 'demo')) # Used by demo-anim.py
+        os.chdir(output)
+        start = snapshot(0)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                runpy.run_path(path, run_name='__main__')
+        finally:
+            os.chdir(directory)
+            sys.path.pop(0)
+
+    total = measure(script, None, start, sum(r.frames for r in renders))
+    if len(results) - first == 1: # A single output is the whole script
+        results.pop()
+    results.insert(first, total)
+
+def report(result):
+    phases = result['phases']
+    total = result['seconds'] or 1
+    print('{:<34} {:>6} {:>8.1f} {:>8.2f}  {}'.format(
+        result['script'] if result['section'] is None else '  ' + result['section'],
+        result['frames'],
+        result['fps'],
+        result['seconds'],
+        ' '.join('{} {:.0%}'.format(phase, phases[phase] / total) for phase in phases)))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark prosvg renders')
+    parser.add_argument('scripts', nargs='*', default=SCRIPTS)
+    parser.add_argument('-o', '--option', action='append', default=[],
+        help='Render option, like raw=True or workers=4')
+    parser.add_argument('--json', help='Write the results to a JSON file')
+    args = parser.parse_args()
+
+    options = {}
+    for option in args.option:
+        key, value = option.split('=', 1)
+        options[key] = ast.literal_eval(value)
+
+    render.FFMPEG_BIN = None
+    instrument(options)
+
+    print('{:<34} {:>6} {:>8} {:>8}  {}'.format('script', 'frames', 'fps', 'seconds', 'phases'))
+    for script in args.scripts:
+        first = len(results)
+        run(script)
+        for result in results[first:]:
+            report(result)
+
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'python': sys.version.split()[0],
+                'cairosvg': render.cairosvg.__version__,
+                'options': options,
+                'results': results
+            }, f, indent=2)
@@ -0,0 +1,633 @@
+import io
+import re
+import math
+import cairocffi
+from cairosvg.colors import color
+from cairosvg.parser import handle_white_spaces
+from cairosvg.helpers import normalize, size, rotate, point_angle, quadratic_points
+from . import svg
+
+# cairosvg draws with cairocffi. pycairo is used instead when it's built on the
+# same version of cairo, other versions can give other pixels
+try:
+    import cairo
+    if cairo.cairo_version() != cairocffi.cairo_version():
+        cairo = cairocffi
+except ImportError:
+    cairo = cairocffi
+
+# Draws svg.Node trees (or ElementTree elements) on cairo surfaces, without
+# writing and parsing svg data. Numbers are rounded like when the drawing is
+# written and elements are drawn with the cairo calls of cairosvg, so both
+# give the same pixels. Anything else raises Unsupported, to rasterize the
+# drawing with cairosvg instead
+
+VERSION = 'prosvg canvas 2, cairo ' + cairo.cairo_version_string()
+
+SVG_NAMESPACE = '{http://www.w3.org/2000/svg}'
+
+# Elements and attributes left to cairosvg: css, references to other elements,
+# clips, masks, filters, markers, nested viewports and text layout options
+UNSUPPORTED_TAGS = frozenset(('style', 'use', 'image', 'a', 'switch', 'svg', 'textPath', 'tref'))
+UNSUPPORTED_ATTRIBUTES = frozenset((
+    'style', 'clip', 'clip-path', 'mask', 'filter', 'marker', 'marker-start',
+    'marker-mid', 'marker-end', 'font', 'transform-origin', 'rotate', 'letter-spacing',
+    'text-rendering', 'display-anchor', 'overflow', 'preserveAspectRatio',
+    'requiredFeatures', 'requiredExtensions', 'systemLanguage', 'href',
+    '{http://www.w3.org/1999/xlink}href', '{http://www.w3.org/XML/1998/namespace}space'))
+
+# Elements whose children aren't drawn, definitions are only drawn when referenced
+HIDDEN_TAGS = frozenset(('defs', 'clipPath', 'filter', 'linearGradient', 'marker',
+    'mask', 'pattern', 'radialGradient', 'symbol'))
+
+# Attributes that children don't inherit
+NOT_INHERITED = frozenset((
+    'clip', 'clip-path', 'display', 'filter', 'height', 'id', 'mask', 'opacity',
+    'overflow', 'rotate', 'stop-color', 'stop-opacity', 'style', 'transform',
+    'transform-origin', 'viewBox', 'width', 'x', 'y', 'dx', 'dy', 'href',
+    '{http://www.w3.org/1999/xlink}href'))
+
+TEXT_TAGS = ('text', 'tspan')
+
+SHAPE_ANTIALIAS = {
+    'optimizeSpeed': cairo.ANTIALIAS_FAST,
+    'crispEdges': cairo.ANTIALIAS_NONE,
+    'geometricPrecision': cairo.ANTIALIAS_BEST
+}
+
+FONT_SLANTS = {'italic': cairo.FONT_SLANT_ITALIC, 'oblique': cairo.FONT_SLANT_OBLIQUE}
+
+# Vertical alignment of text, as a function of the ascent and descent of the font
+BASELINES = {'central': lambda a, d: (a + d) / 2 - d, 'middle': lambda a, d: (a + d) / 2 - d}
+BASELINES.update(dict.fromkeys(('text-before-edge', 'before_edge', 'top', 'hanging', 'text-top'), lambda a, d: a))
+BASELINES.update(dict.fromkeys(('text-after-edge', 'after_edge', 'bottom', 'text-bottom'), lambda a, d: -d))
+
+ARC_TO_BEZIER = 4 * (2 ** .5 - 1) / 3 # Control points of rounded corners
+
+# Templates and numbers of transforms, viewBoxes and other lists of numbers
+NUMBER = re.compile(r'\{\}|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+NUMBERS = re.compile(r'(?:\{\}|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?|[\s,])*')
+TRANSFORM = re.compile(r'(\w+)\s*\(([^)]*)\)')
+
+# Letters of the templates written by Path commands
+PATH_LETTERS = {template: letter for letter, template in svg.PATH_FORMATS.items()}
+
+class Unsupported(Exception):
+    pass
+
+def tagName(node):
+    tag = node.tag
+    return tag[len(SVG_NAMESPACE):] if tag.startswith(SVG_NAMESPACE) else tag
+
+# Rasterizes a tree, returns a png image or the raw pixels of the surface.
+# viewBox renders a part of the drawing, children a subset of its elements and
+# precision is the number of decimal digits of the drawing
+def rasterize(root, scale, raw=False, background=None, viewBox=None, children=None, precision=None):
+    return Painter(precision).rasterize(root, scale, raw, background, viewBox, children)
+
+class Painter():
+    def __init__(self, precision=None):
+        self.precision = svg.PRECISION if precision is None else precision
+        self.context = None
+        self.root = None
+        # Names read by cairosvg's size(), for lengths with units
+        self.dpi = 96
+        self.context_width = None
+        self.context_height = None
+        self.font_size = self.defaultFontSize = size(self, '12pt')
+        self.cursor = (0, 0) # Position of the next letter
+        self.shift = [0, 0] # dx and dy of the letters of a text element
+        self.texts = {} # Text of every tspan, after handling white space
+
+    def rasterize(self, root, scale, raw=False, background=None, viewBox=None, children=None):
+        if tagName(root) != 'svg':
+            raise Unsupported(root.tag)
+        if viewBox is None:
+            viewBox = self.numbers(root.attrib.get('viewBox', ''))
+            if viewBox is None or len(viewBox) != 4:
+                raise Unsupported('viewBox')
+        x, y, viewWidth, viewHeight = viewBox
+        width = (self.length(root.attrib.get('width'), 'x') or viewWidth) * scale
+        height = (self.length(root.attrib.get('height'), 'y') or viewHeight) * scale
+
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, int(round(width)), int(round(height)))
+        if 0 in (surface.get_width(), surface.get_height()):
+            raise ValueError('The SVG size is undefined')
+        if background is not None:
+            surface.get_data()[:] = background
+            surface.mark_dirty()
+        context = self.context = cairo.Context(surface)
+        self.root = root
+
+        # Fits the viewBox in the middle of the surface, and clips it
+        k = min(width / viewWidth if viewWidth > 0 else 1, height / viewHeight if viewHeight > 0 else 1)
+        context.translate(-x * k, -y * k)
+        context.rectangle(x * k, y * k, width, height)
+        context.clip()
+        context.scale(k, k)
+        context.translate((width / k - viewWidth) / 2, (height / k - viewHeight) / 2)
+        self.context_width = width / k
+        self.context_height = height / k
+        context.move_to(0, 0)
+
+        self.draw(root, {}, children)
+
+        surface.flush()
+        if raw:
+            return bytes(surface.get_data())
+        png = io.BytesIO()
+        surface.write_to_png(png)
+        return png.getvalue()
+
+    # Numbers, as written in the svg data with the precision of the drawing or
+    # their own digits
+    def round(self, value, digits):
+        if type(value) is str:
+            raise Unsupported(value)
+        return float(round(value, digits))
+
+    # Template of a NumberData (or a string) and its numbers
+    def numberData(self, value):
+        if type(value) is str:
+            return value, iter(())
+        template = ''
+        numbers = []
+        for part, values, digits in value.parts:
+            template += part
+            numbers += [self.round(v, self.precision if digits is None else digits) for v in values]
+        return template, iter(numbers)
+
+    # List of numbers of a NumberData or a string, None if it has units or other text
+    def numbers(self, value):
+        template, numbers = self.numberData(value)
+        if NUMBERS.fullmatch(template) is None:
+            return None
+        return [next(numbers) if token == '{}' else float(token) for token in NUMBER.findall(template)]
+
+    def string(self, value):
+        return value if type(value) is str else svg.formatValue(value, self.precision)
+
+    # Length in user units, reference is used for percentages (see cairosvg's size)
+    def length(self, value, reference='xy'):
+        if value is None:
+            return 0
+        if type(value) is int or type(value) is float:
+            return float(round(value, self.precision))
+        numbers = self.numbers(value)
+        if numbers is not None and len(numbers) == 1:
+            return numbers[0]
+        return size(self, self.string(value), reference)
+
+    def lengths(self, value, reference='xy'):
+        if value is None:
+            return []
+        if type(value) is int or type(value) is float:
+            return [float(round(value, self.precision))]
+        numbers = self.numbers(value)
+        if numbers is not None:
+            return numbers
+        return [size(self, v, reference) for v in normalize(self.string(value)).split()]
+
+    def color(self, value, opacity):
+        if value is None:
+            return (0, 0, 0, 0)
+        value = self.string(value).strip()
+        if 'url(' in value:
+            raise Unsupported(value)
+        return color(value or None, opacity)
+
+    def draw(self, node, inherited, children=None):
+        context = self.context
+        tag = tagName(node)
+        attrib = node.attrib
+        if tag in UNSUPPORTED_TAGS and node is not self.root:
+            raise Unsupported(tag)
+        if not UNSUPPORTED_ATTRIBUTES.isdisjoint(attrib):
+            raise Unsupported(tag)
+        if tag in HIDDEN_TAGS:
+            if any(tagName(n) == 'style' for n in node.iter()): # Css applies to the whole drawing
+                raise Unsupported('style')
+            return
+        for value in attrib.values():
+            if type(value) is str and (value == 'inherit' or value == 'currentColor'):
+                raise Unsupported(value)
+        if ('width' in attrib and self.length(attrib['width']) == 0 or
+                'height' in attrib and self.length(attrib['height']) == 0):
+            return
+
+        attributes = dict(inherited)
+        attributes.update(attrib)
+        fontSize = self.font_size
+        self.font_size = self.length(attributes['font-size']) if 'font-size' in attributes else self.defaultFontSize
+        if children is None:
+            children = node
+        context.save()
+
+        if 'transform' in attrib:
+            self.transform(attrib['transform'])
+        opacity = self.length(attrib.get('opacity', 1))
+        group = opacity < 1 and len(children) > 0
+        if group:
+            context.push_group()
+        context.move_to(self.length(attrib.get('x'), 'x'), self.length(attrib.get('y'), 'y'))
+
+        lineCap = attributes.get('stroke-linecap')
+        if lineCap == 'square':
+            context.set_line_cap(cairo.LINE_CAP_SQUARE)
+        elif lineCap == 'round':
+            context.set_line_cap(cairo.LINE_CAP_ROUND)
+        lineJoin = attributes.get('stroke-linejoin')
+        if lineJoin == 'round':
+            context.set_line_join(cairo.LINE_JOIN_ROUND)
+        elif lineJoin == 'bevel':
+            context.set_line_join(cairo.LINE_JOIN_BEVEL)
+        dashes = self.lengths(attributes.get('stroke-dasharray'))
+        if sum(dashes):
+            context.set_dash(dashes, self.length(attributes.get('stroke-dashoffset')))
+        context.set_miter_limit(self.length(attributes.get('stroke-miterlimit', 4)))
+
+        if tag == 'text':
+            self.texts = {}
+            self.layoutText(node, True, True)
+        letters = None
+        if tag in TEXT_TAGS:
+            letters = self.text(node, attributes)
+        elif tag in SHAPES:
+            SHAPES[tag](self, attrib)
+
+        fillOpacity = self.length(attributes.get('fill-opacity', 1))
+        strokeOpacity = self.length(attributes.get('stroke-opacity', 1))
+        if opacity < 1 and not group:
+            fillOpacity *= opacity
+            strokeOpacity *= opacity
+
+        display = attrib.get('display', 'inline') != 'none'
+        visible = display and attributes.get('visibility', 'visible') != 'hidden'
+        if 'shape-rendering' in attributes:
+            context.set_antialias(SHAPE_ANTIALIAS.get(attributes['shape-rendering'], cairo.ANTIALIAS_DEFAULT))
+
+        if visible and (letters is not None or tag in SHAPES):
+            fill = self.color(attributes.get('fill', 'black'), fillOpacity)
+            stroke = self.color(attributes.get('stroke'), strokeOpacity)
+            if letters is not None:
+                if fill[3] > 0:
+                    context.set_source_rgba(*fill)
+                    self.drawText(letters, context.show_text)
+                if stroke[3] > 0:
+                    self.drawText(letters, context.text_path)
+            elif fill[3] > 0: # Transparent paint doesn't change the surface
+                context.set_source_rgba(*fill)
+                if attributes.get('fill-rule') == 'evenodd':
+                    context.save()
+                    context.set_fill_rule(cairo.FILL_RULE_EVEN_ODD)
+                    context.fill_preserve()
+                    context.restore()
+                else:
+                    context.fill_preserve()
+            if stroke[3] > 0:
+                context.set_line_width(self.length(attributes.get('stroke-width', 1)))
+                context.set_source_rgba(*stroke)
+                context.stroke()
+            else:
+                context.new_path()
+        elif not visible:
+            context.new_path()
+
+        if display and len(children) > 0:
+            inheritable = {key: value for key, value in attributes.items() if key not in NOT_INHERITED}
+            for child in children:
+                self.draw(child, inheritable)
+
+        if group:
+            context.pop_group_to_source()
+            context.paint_with_alpha(opacity)
+        if tag == 'text':
+            self.cursor = (0, 0)
+            self.shift = [0, 0]
+        context.restore()
+        self.font_size = fontSize
+
+    # Applies the functions of a transform attribute to the context
+    def transform(self, value):
+        template, numbers = self.numberData(value)
+        matrix = cairo.Matrix()
+        for function, arguments in TRANSFORM.findall(template):
+            values = [next(numbers) if token == '{}' else float(token) for token in NUMBER.findall(arguments)]
+            if function == 'matrix':
+                matrix = cairo.Matrix(*values).multiply(matrix)
+            elif function == 'rotate':
+                x, y = values[1:] or (0, 0)
+                matrix.translate(x, y)
+                matrix.rotate(math.radians(values[0]))
+                matrix.translate(-x, -y)
+            elif function == 'skewX':
+                matrix = cairo.Matrix(1, 0, math.tan(math.radians(values[0])), 1, 0, 0).multiply(matrix)
+            elif function == 'skewY':
+                matrix = cairo.Matrix(1, math.tan(math.radians(values[0])), 0, 1, 0, 0).multiply(matrix)
+            elif function == 'translate':
+                matrix.translate(values[0], values[1] if len(values) > 1 else 0)
+            elif function == 'scale':
+                matrix.scale(values[0], values[1] if len(values) > 1 else values[0])
+        try:
+            matrix.invert()
+        except cairo.Error: # Nothing is drawn, like scales by 0
+            self.context.new_path()
+            self.context.clip()
+        else: # Inverted back, the factors are rounded like in cairosvg
+            matrix.invert()
+            self.context.transform(matrix)
+
+    # Texts of a text element and its tspans, with the white space rules of cairosvg
+    def layoutText(self, node, trailing, root=False):
+        text = handle_white_spaces(node.text, False)
+        if trailing:
+            text = text.lstrip(' ')
+        if text:
+            trailing = text.endswith(' ')
+        for child in node:
+            if child.tail:
+                raise Unsupported('tail')
+            self.layoutText(child, trailing)
+            trailing = self.texts[child].endswith(' ')
+        if root and len(node) == 0:
+            text = text.rstrip(' ')
+        self.texts[node] = text
+
+    # Selects the font of a text element or tspan and places its letters, as
+    # (x, y, dx, dy, letter). Moves the cursor to the end of the text
+    def text(self, node, attributes):
+        context = self.context
+        text = self.texts.get(node)
+        if text is None: # Outside of a text element
+            raise Unsupported(node.tag)
+
+        family = (self.string(attributes.get('font-family', '')) or 'sans-serif').split(',')[0].strip('"\' ')
+        weight = self.string(attributes.get('font-weight', 'normal'))
+        bold = weight == 'bold' or weight.isdigit() and int(weight) >= 550
+        context.select_font_face(family, FONT_SLANTS.get(attributes.get('font-style'), cairo.FONT_SLANT_NORMAL),
+            cairo.FONT_WEIGHT_BOLD if bold else cairo.FONT_WEIGHT_NORMAL)
+        context.set_font_size(self.font_size)
+
+        attrib = node.attrib
+        xs, ys = self.lengths(attrib.get('x'), 'x'), self.lengths(attrib.get('y'), 'y')
+        dxs, dys = self.lengths(attrib.get('dx'), 'x'), self.lengths(attrib.get('dy'), 'y')
+        if not text:
+            x = xs[0] if xs else self.cursor[0]
+            y = ys[0] if ys else self.cursor[1]
+            self.cursor = (x + (dxs[0] if dxs else 0), y + (dys[0] if dys else 0))
+            return []
+
+        xBearing, _, width = context.text_extents(text)[:3]
+        anchor = attributes.get('text-anchor')
+        alignX = -(width / 2 + xBearing) if anchor == 'middle' else -(width + xBearing) if anchor == 'end' else 0
+        alignY = 0
+        baseline = attributes.get('dominant-baseline') or attributes.get('alignment-baseline')
+        if baseline in BASELINES:
+            ascent, descent, _, maxAdvanceX, maxAdvanceY = context.font_extents()
+            if maxAdvanceX > 0 and maxAdvanceY == 0: # Horizontal fonts
+                alignY = BASELINES[baseline](ascent, descent)
+
+        letters = []
+        for i, letter in enumerate(text):
+            x = xs[i] if i < len(xs) else None
+            y = ys[i] if i < len(ys) else None
+            if x: # Absolute positions reset the shifts, unless they are 0
+                self.shift[0] = 0
+            if y:
+                self.shift[1] = 0
+            self.shift[0] += dxs[i] if i < len(dxs) else 0
+            self.shift[1] += dys[i] if i < len(dys) else 0
+            x = self.cursor[0] if x is None else x
+            y = self.cursor[1] if y is None else y
+            letters.append((x, y, self.shift[0], self.shift[1], alignX, alignY, letter))
+            self.cursor = (x + context.text_extents(letter)[4], y)
+        return letters
+
+    def drawText(self, letters, draw): # draw is show_text or text_path
+        context = self.context
+        for x, y, dx, dy, alignX, alignY, letter in letters:
+            context.move_to(x, y)
+            context.rel_move_to(dx, dy)
+            context.rel_move_to(alignX, alignY)
+            if not letter.isspace():
+                draw(letter)
+
+    # Shapes
+
+    def circle(self, attrib):
+        r = self.length(attrib.get('r'))
+        if not r:
+            return
+        self.context.new_sub_path()
+        self.context.arc(self.length(attrib.get('cx'), 'x'), self.length(attrib.get('cy'), 'y'), r, 0, 2 * math.pi)
+        self.context.close_path()
+
+    def ellipse(self, attrib):
+        rx, ry = self.length(attrib.get('rx'), 'x'), self.length(attrib.get('ry'), 'y')
+        if not rx or not ry:
+            return
+        cx, cy = self.length(attrib.get('cx'), 'x'), self.length(attrib.get('cy'), 'y')
+        ratio = ry / rx
+        context = self.context
+        context.new_sub_path()
+        context.save()
+        context.scale(1, ratio)
+        context.arc(cx, cy / ratio, rx, 0, 2 * math.pi)
+        context.close_path()
+        context.restore()
+
+    def line(self, attrib):
+        self.context.move_to(self.length(attrib.get('x1'), 'x'), self.length(attrib.get('y1'), 'y'))
+        self.context.line_to(self.length(attrib.get('x2'), 'x'), self.length(attrib.get('y2'), 'y'))
+
+    def polyline(self, attrib, closed=False):
+        points = attrib.get('points')
+        if type(points) is svg.PointsData:
+            values = [float(round(c, self.precision)) for c in points.coordinates]
+        else:
+            values = [float(v) for v in NUMBER.findall(self.string(points or ''))]
+        context = self.context
+        for i in range(0, len(values) - 1, 2):
+            if i == 0:
+                context.move_to(values[0], values[1])
+            else:
+                context.line_to(values[i], values[i + 1])
+        if closed and len(values) % 2 == 0: # A missing coordinate stops the shape
+            context.close_path()
+
+    def polygon(self, attrib):
+        self.polyline(attrib, True)
+
+    def rect(self, attrib):
+        x, y = self.length(attrib.get('x'), 'x'), self.length(attrib.get('y'), 'y')
+        width, height = self.length(attrib.get('width'), 'x'), self.length(attrib.get('height'), 'y')
+        rx, ry = attrib.get('rx'), attrib.get('ry')
+        if ry is None:
+            ry = rx
+        elif rx is None:
+            rx = ry
+        rx, ry = self.length(rx, 'x'), self.length(ry, 'y')
+        context = self.context
+        if rx == 0 or ry == 0:
+            context.rectangle(x, y, width, height)
+            return
+        rx, ry = min(rx, width / 2), min(ry, height / 2)
+        c1, c2 = ARC_TO_BEZIER * rx, ARC_TO_BEZIER * ry
+        context.new_path()
+        context.move_to(x + rx, y)
+        context.rel_line_to(width - 2 * rx, 0)
+        context.rel_curve_to(c1, 0, rx, c2, rx, ry)
+        context.rel_line_to(0, height - 2 * ry)
+        context.rel_curve_to(0, c2, c1 - rx, ry, -rx, ry)
+        context.rel_line_to(-width + 2 * rx, 0)
+        context.rel_curve_to(-c1, 0, -rx, -c2, -rx, -ry)
+        context.rel_line_to(0, -height + 2 * ry)
+        context.rel_curve_to(0, -c2, rx - c1, -ry, rx, -ry)
+        context.close_path()
+
+    # (letter, values) of the commands of path data, the numbers of PathData
+    # commands are rounded instead of being written and parsed
+    def pathCommands(self, d):
+        parts = [d] if type(d) is str else d.parts
+        for part in parts:
+            if type(part) is str:
+                try:
+                    yield from svg.parsePath(part)
+                except (KeyError, AttributeError):
+                    raise Unsupported(part)
+                continue
+            template, values, count = part
+            letter = PATH_LETTERS.get(template)
+            if letter is None: # Written by Path.command with another template
+                data = svg.PathData()
+                data.parts = [part]
+                yield from self.pathCommands(data.format(self.precision))
+                continue
+            values = [self.round(v, self.precision) for v in values]
+            if count == 0:
+                yield letter, values
+            for i in range(0, len(values), count or 1):
+                yield letter, values[i:i + count]
+
+    def path(self, attrib):
+        d = attrib.get('d')
+        if d is None:
+            return
+        context = self.context
+        x, y = context.get_current_point()
+        start = None # Where the subpath started, once it draws something
+        control = None # Last control point of cubic curves, absolute
+        previous = None
+        for letter, values in self.pathCommands(d):
+            if previous is None or previous in 'mMzZ':
+                start = None
+            if start is None and letter not in 'mMzZ':
+                start = (x, y)
+
+            if letter == 'M':
+                x, y = values
+                context.move_to(x, y)
+            elif letter == 'm':
+                context.rel_move_to(*values)
+                x, y = x + values[0], y + values[1]
+            elif letter == 'L':
+                x, y = values
+                context.line_to(x, y)
+            elif letter == 'l':
+                context.rel_line_to(*values)
+                x, y = x + values[0], y + values[1]
+            elif letter == 'H':
+                x = values[0]
+                context.line_to(x, y)
+            elif letter == 'h':
+                context.rel_line_to(values[0], 0)
+                x += values[0]
+            elif letter == 'V':
+                y = values[0]
+                context.line_to(x, y)
+            elif letter == 'v':
+                context.rel_line_to(0, values[0])
+                y += values[0]
+            elif letter == 'C':
+                context.curve_to(*values)
+                control = values[2:4]
+                x, y = values[4:]
+            elif letter == 'c':
+                context.rel_curve_to(*values)
+                control = (x + values[2], y + values[3])
+                x, y = x + values[4], y + values[5]
+            elif letter in 'Ss':
+                smooth = previous is not None and previous in 'cCsS'
+                if letter == 'S': # First control point reflected around the current point
+                    x1, y1 = (x + (x - control[0]), y + (y - control[1])) if smooth else (x, y)
+                    context.curve_to(x1, y1, *values)
+                    control = values[0:2]
+                    x, y = values[2:]
+                else:
+                    x1, y1 = (x - control[0], y - control[1]) if smooth else (0, 0)
+                    context.rel_curve_to(x1, y1, *values)
+                    control = (x + values[0], y + values[1])
+                    x, y = x + values[2], y + values[3]
+            elif letter == 'Q':
+                context.curve_to(*quadratic_points(x, y, *values))
+                x, y = values[2:]
+            elif letter == 'q':
+                context.rel_curve_to(*quadratic_points(0, 0, *values))
+                x, y = x + values[2], y + values[3]
+            elif letter in 'Aa':
+                context.set_tolerance(0.00001)
+                rx, ry, angle, large, sweep, dx, dy = values
+                if letter == 'A':
+                    dx, dy = dx - x, dy - y
+                if large not in (0, 1) or sweep not in (0, 1):
+                    continue
+                if not rx or not ry: # Straight line
+                    context.rel_line_to(dx, dy)
+                    x, y = x + dx, y + dy
+                    previous = 'l'
+                    continue
+                self.arc(x, y, rx, ry, math.radians(angle), bool(large), bool(sweep), dx, dy)
+                x, y = x + dx, y + dy
+            elif letter in 'zZ':
+                if start is not None:
+                    context.close_path()
+                    x, y = start
+            else: # Smooth quadratic curves
+                raise Unsupported(letter)
+            previous = letter
+
+    # Elliptical arc from (x, y) to (x + dx, y + dy)
+    def arc(self, x, y, rx, ry, angle, large, sweep, dx, dy):
+        ratio = ry / rx
+        # End point in the coordinates of the ellipse, on the x axis
+        xe, ye = rotate(dx, dy, -angle)
+        ye /= ratio
+        turn = point_angle(0, 0, xe, ye)
+        xe = math.hypot(xe, ye)
+        rx = max(rx, xe / 2)
+        # Center, on one side or the other of the chord
+        xc = xe / 2
+        yc = (rx ** 2 - xc ** 2) ** .5
+        if not (large ^ sweep):
+            yc = -yc
+        xe, ye = rotate(xe, 0, turn)
+        xc, yc = rotate(xc, yc, turn)
+
+        context = self.context
+        context.save()
+        context.translate(x, y)
+        context.rotate(angle)
+        context.scale(1, ratio)
+        (context.arc if sweep else context.arc_negative)(
+            xc, yc, rx, point_angle(xc, yc, 0, 0), point_angle(xc, yc, xe, ye))
+        context.restore()
+
+SHAPES = {
+    'circle': Painter.circle,
+    'ellipse': Painter.ellipse,
+    'line': Painter.line,
+    'path': Painter.path,
+    'polygon': Painter.polygon,
+    'polyline': Painter.polyline,
+    'rect': Painter.rect
+}
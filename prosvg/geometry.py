@@ -1,4 +1,5 @@
 import math
+import time
 from . import svg
 
 # Ease Functions
@@ -47,27 +48,68 @@ def R(r, angle):
 def P3D(x=0, y=0, z=0):
     return svg.Point3D(x, y, z)
 
+# Name of the method that created an action or a motion, like Circle.rotate
+def actionName(action):
+    return action.__qualname__.replace('.<locals>.action', '').replace('.<locals>.motion', '')
+
 class Animation():
     def __init__(self, action=None, runTime=0, onEnd=None):
         self.runTime = runTime
         self.t = 0
+        self.motions = [] # [motion, eased time] of every motion
+        self.owner = None # Object moved by the motions
+        self.base = None # State of the owner without its motions
         if action is None:
             self.transition = []
         else:
             self.transition = [(action, runTime, onEnd)]
 
+    # Seeks the animation to time t. Actions get the time of their own
+    # transition and the change since the last evaluated time. Motions (see
+    # AnimatedObject.addMotion) are applied once all the actions ran, and only
+    # depend on the time, so any frame can be computed without running the
+    # previous ones. The time spent in every action is added to timings, keyed
+    # by actionName
+    def evaluate(self, t, timings=None):
+        t = min(max(t, 0), self.runTime)
+        if len(self.motions) > 0:
+            self.owner.setMotionState(self.base)
+        for f in self.transition:
+            current = min(t, f[1])
+            previous = min(self.t, f[1])
+            if current != previous:
+                if timings is None:
+                    f[0](current/f[1], (current - previous)/f[1])
+                else:
+                    start = time.perf_counter()
+                    f[0](current/f[1], (current - previous)/f[1])
+                    name = actionName(f[0])
+                    timings[name] = timings.get(name, 0) + time.perf_counter() - start
+        self.t = t
+        if len(self.motions) > 0:
+            self.base = self.owner.motionState()
+            for motion, amount in self.motions:
+                if timings is None:
+                    motion(amount)
+                else:
+                    start = time.perf_counter()
+                    motion(amount)
+                    name = actionName(motion)
+                    timings[name] = timings.get(name, 0) + time.perf_counter() - start
+
     def run(self, dt):
-        self.t += dt
-        if self.t > self.runTime:
+        if self.t + dt > self.runTime:
             # The animation has ended
-            for f in self.transition:
-                if f[2] is not None:
-                    f[2]()
-            self.reset()
+            self.finish()
             return
+        self.evaluate(self.t + dt)
+
+    def finish(self, timings=None): # Jumps to the end of the animation
+        self.evaluate(self.runTime, timings)
         for f in self.transition:
-            if self.t <= f[1] + dt:
-                f[0](self.t/f[1], dt/f[1])
+            if f[2] is not None:
+                f[2]()
+        self.reset()
 
     def add(self, action, runTime, onEnd=None):
         self.runTime = max(self.runTime, runTime)
@@ -77,6 +119,9 @@ class Animation():
         self.t = 0
         self.transition = []
         self.runTime = 0
+        self.motions = []
+        self.owner = None
+        self.base = None
 
 # An animated object can be animated using an animation
 class AnimatedObject():
@@ -95,14 +140,39 @@ class AnimatedObject():
         self.animation = Animation(action, time)
         return self
 
-    # Movement functions, needs to implement position(get, set) on children objects
-    def move(self, deltaVector, time=1, ease=easeInOut):
+    # Motions, like moves and rotations, are functions that change the object
+    # by an amount (the eased time, 0 to 1). On every frame the object goes back
+    # to its state without motions (the state when the first motion was added,
+    # changed by the other actions of the animation) and every motion is applied
+    # once, in order, so simultaneous motions add up and rounding errors don't
+    # build up over the frames
+    def addMotion(self, motion, time=1, ease=easeInOut):
+        animation = self.animation
+        if len(animation.motions) == 0:
+            animation.owner = self
+            animation.base = self.motionState()
+        entry = [motion, 0]
+        animation.motions.append(entry)
         def action(t, dt):
-            delta = deltaVector * (ease(t) - ease(t - dt)) 
-            self.position += delta
-        self.animation.add(action, time)
+            entry[1] = ease(t)
+        action.__qualname__ = motion.__qualname__[:-len('motion')] + 'action' # See actionName
+        animation.add(action, time)
         return self
 
+    # State changed by motions, the position by default. Other actions change
+    # the object on top of this state
+    def motionState(self):
+        return self.position
+
+    def setMotionState(self, state):
+        self.position = state
+
+    # Movement functions
+    def move(self, deltaVector, time=1, ease=easeInOut):
+        def motion(amount):
+            self.position = self.position + deltaVector * amount
+        return self.addMotion(motion, time, ease)
+
     def moveTo(self, dest, time=1, ease=easeInOut):
         return self.move(dest - self.position, time, ease)
 
@@ -170,21 +240,19 @@ class Vector(svg.Line, AnimatedObject):
     def position(self, pos):
         self.set(pos, pos + (self.p2 - self.p1))
 
+    def motionState(self):
+        return (self.p1, self.p2)
+
+    def setMotionState(self, state):
+        self.set(*state)
+
     def rotate(self, angle, center=None, time=1, ease=easeInOut):
         if center is None:
             center = self.p1
-        start1 = self.p1 - center
-        start2 = self.p2 - center
-        def action(t, dt):
-            a1 = angle * ease(t)
-            a2 = angle * ease(t-dt)
-            delta1 = start1.rotate(a1) - start1.rotate(a2)
-            delta2 = start2.rotate(a1) - start2.rotate(a2)
-            
-            self.set(self.p1 + delta1, self.p2 + delta2)
-        
-        self.animation.add(action, time)
-        return self
+        def motion(amount):
+            a = angle * amount
+            self.set(center + (self.p1 - center).rotate(a), center + (self.p2 - center).rotate(a))
+        return self.addMotion(motion, time, ease)
 
 class Circle(svg.Circle, AnimatedObject):
     def __init__(self, center, r, style={}):
@@ -229,29 +297,29 @@ class Circle(svg.Circle, AnimatedObject):
         self.set(pos, self.r)
 
     def rotate(self, angle, center, time=1, ease=easeInOut):
-        start = self.center - center
-
-        def action(t, dt):
-            delta = start.rotate(angle * ease(t)) - start.rotate(angle * ease(t - dt))
-            self.set(self.center + delta , self.r)
-        self.animation.add(action, time)
-        return self
+        def motion(amount):
+            self.set(center + (self.center - center).rotate(angle * amount), self.r)
+        return self.addMotion(motion, time, ease)
 
+# With a tolerance (in pixels at renderScale), curves start with n samples and
+# are split where they bend, see svg.Path.parametric
 class Parametric(svg.Path, AnimatedObject):
-    def __init__(self, origin, f, t0, t1, style={}, n=30):
+    def __init__(self, origin, f, t0, t1, style={}, n=30, tolerance=None, renderScale=1):
         svg.Path.__init__(self, style)
         AnimatedObject.__init__(self)
-        self.set(origin, f, t0, t1, n)
+        self.renderScale = renderScale
+        self.set(origin, f, t0, t1, n, tolerance)
 
-    def set(self, origin, f, t0, t1, n=30):
+    def set(self, origin, f, t0, t1, n=30, tolerance=None):
         self.origin = origin
         self.f = f
         self.t0 = t0
         self.t1 = t1
         self.n = n
+        self.tolerance = tolerance
         self.clear()
         parametric = lambda t: f(t) + self.origin
-        self.parametric(parametric, t0, t1, n)
+        self.parametric(parametric, t0, t1, n, tolerance=tolerance, renderScale=self.renderScale)
 
     # Transforms a Function (interpolation)
     def transformFunction(self, newFunction, time=1, ease=easeInOut):
@@ -259,10 +327,10 @@ class Parametric(svg.Path, AnimatedObject):
         def action(t, dt):
             f = lambda x: interpolate(oldFunction(x), newFunction(x), t, ease)
 
-            self.set(self.origin, f, self.t0, self.t1, self.n)
+            self.set(self.origin, f, self.t0, self.t1, self.n, self.tolerance)
         def onEnd():
             f = newFunction
-            self.set(self.origin, newFunction, self.t0, self.t1, self.n)
+            self.set(self.origin, newFunction, self.t0, self.t1, self.n, self.tolerance)
 
         self.animation.add(action, time, onEnd)
         return self
@@ -271,7 +339,7 @@ class Parametric(svg.Path, AnimatedObject):
     def updateFunction(self, functionGenerator, time=1, ease=easeInOut):
         def action(t, dt):
             function = functionGenerator(ease(t))
-            self.set(self.origin, function, self.t0, self.t1, self.n)
+            self.set(self.origin, function, self.t0, self.t1, self.n, self.tolerance)
         self.animation.add(action, time)
         return self
 
@@ -279,7 +347,7 @@ class Parametric(svg.Path, AnimatedObject):
         def action(t, dt):
             current_x0 = interpolate(x0, x2, t, ease) 
             current_x1 = interpolate(x1, x3, t, ease) 
-            self.set(self.origin, self.f, current_x0, current_x1, self.n)
+            self.set(self.origin, self.f, current_x0, current_x1, self.n, self.tolerance)
         self.animation.add(action, time)
         return self
 
@@ -317,20 +385,22 @@ class Parametric(svg.Path, AnimatedObject):
         return self.updateFunction(generator)
 
 class Function(Parametric):
-    def __init__(self, origin, f, x0, x1, style={}, n=30):
+    def __init__(self, origin, f, x0, x1, style={}, n=30, tolerance=None, renderScale=1):
         svg.Path.__init__(self, style)
         AnimatedObject.__init__(self)
-        self.set(origin, f, x0, x1, n)
+        self.renderScale = renderScale
+        self.set(origin, f, x0, x1, n, tolerance)
 
-    def set(self, origin, f, x0, x1, n=30):
+    def set(self, origin, f, x0, x1, n=30, tolerance=None):
         self.origin = origin
         self.f = f
         self.t0 = x0
         self.t1 = x1
         self.n = n
+        self.tolerance = tolerance
         parametric = lambda x: svg.Point(x + origin.x, f(x) + origin.y)
         self.clear()
-        self.parametric(parametric, x0, x1, n)
+        self.parametric(parametric, x0, x1, n, tolerance=tolerance, renderScale=self.renderScale)
 
 class Polygon(svg.Polygon, AnimatedObject):
     def __init__(self, points, style={}):
@@ -339,11 +409,16 @@ class Polygon(svg.Polygon, AnimatedObject):
         AnimatedObject.__init__(self)
         self.scale=1
 
-    def set(self, points, scale=1):
+    def set(self, points, scale=1): # Points scaled around their center
         self.initialPoints = points
         self.scale = scale
-        scaledPoints = [self.center + scale * (p - self.center) for p in points]
-        self.points = scaledPoints
+        self.points = points
+        if scale != 1:
+            center = self.center
+            if isinstance(points, svg.PointArray):
+                self.points = center + scale * (points - center)
+            else:
+                self.points = [center + scale * (p - center) for p in points]
 
     def changeScale(self, start, end, time=1, ease=easeInOut):
         def action(t, dt):
@@ -370,25 +445,28 @@ class Polygon(svg.Polygon, AnimatedObject):
 
     @position.setter
     def position(self, pos):
-        c = self.center
-        self.set([pos + (p - c) for p in self.points])
+        delta = pos - self.center
+        if isinstance(self.initialPoints, svg.PointArray):
+            self.set(self.initialPoints + delta, self.scale)
+        else:
+            self.set([p + delta for p in self.initialPoints], self.scale)
+
+    def motionState(self):
+        return (self.initialPoints, self.scale)
+
+    def setMotionState(self, state):
+        self.set(*state)
 
     def rotate(self, angle, center=None, time=1, ease=easeInOut):
         if center is None:
             center = self.center
-        initial = [p - center for p in self.points]
-        def action(t, dt):
-            points = []
-            a1 = angle * ease(t)
-            a2 = angle * ease(t - dt)
-            for p in range(len(initial)):
-                delta = initial[p].rotate(a1) - initial[p].rotate(a2)
-                points.append(self.points[p] + delta)
-
-            self.set(points, self.scale)
-
-        self.animation.add(action, time)
-        return self
+        def motion(amount):
+            a = angle * amount
+            if isinstance(self.initialPoints, svg.PointArray):
+                self.set(center + (self.initialPoints - center).rotate(a), self.scale)
+            else:
+                self.set([center + (p - center).rotate(a) for p in self.initialPoints], self.scale)
+        return self.addMotion(motion, time, ease)
 
 class RegularPolygon(Polygon):
     def __init__(self, center, vertex, sides, style={}):
@@ -433,8 +511,8 @@ class Text(svg.Text, AnimatedObject):
         self.set(pos, self.text)
 
     def fadeText(self, newText, time=1, ease=easeInOut):
+        startText = self.text
         def action(t, dt):
-            startText = self.text
             if ease(t) >= 0.5:
                 self.set(self.origin, newText)
                 self.setAttributes({'opacity': round(2 * ease(t) - 1, 2)})
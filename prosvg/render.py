@@ -1,11 +1,445 @@
+import os
+import io
+import sys
+import math
+import json
+import atexit
+import tempfile
+import time
+import hashlib
 import subprocess
+import threading
+import queue
+import collections
+import concurrent.futures
+import multiprocessing
 import cairosvg
+import xml.etree.ElementTree as ET
 from . import svg
 
-FFMPEG_BIN = 'ffmpeg'
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+FFMPEG_BIN = 'ffmpeg' # None discards the frames, used for benchmarks
+
+# Reads frames from a pipe and discards them
+NULL_SINK = 'import sys\nwhile sys.stdin.buffer.read(1 << 20): pass'
+
+# Cairo stores ARGB32 pixels in native byte order, with premultiplied alpha.
+# ffmpeg reads straight alpha, see unpremultiply
+PIXEL_FORMAT = 'bgra' if sys.byteorder == 'little' else 'argb'
+ALPHA_BYTE = PIXEL_FORMAT.index('a')
+
+# Preview renders use a fraction of the scale and frame rate of every output
+PREVIEW_VARIABLE = 'PROSVG_PREVIEW'
+PREVIEW_SCALE = 0.5
+PREVIEW_FPS = 0.5
+
+# Image sequences, like frames/%06d.png, keep the hash of every written frame
+# in this file of their directory, frames with the same hash aren't written again
+SEQUENCE_FORMATS = ('.png', '.svg')
+SEQUENCE_MANIFEST = '.prosvg-frames.jsonl'
+
+# Animated images are encoded in a single pass. The palette is computed once,
+# from the pixels that change in a sample of the frames, and every frame only
+# stores the rectangle that changed since the previous one
+ANIMATED_FORMATS = ('.gif', '.webp', '.apng')
+PALETTE_SAMPLING = 4 # Every Nth frame is used for the palette
+
+# Default directory of Render(..., cache=True)
+CACHE_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'prosvg')
+CACHE_SIZE = 1 << 30 # Bytes
+
+# Environment variables used by renderSegments
+SEGMENT_VARIABLE = 'PROSVG_SEGMENT' # first:last:index:segments
+MANIFEST_VARIABLE = 'PROSVG_MANIFEST'
+
+# Surface drawn on top of the pixels of an existing raster
+class LayerSurface(cairosvg.surface.PNGSurface):
+    def __init__(self, tree, scale, background=None):
+        self.background = background
+        super().__init__(tree, None, 96, scale=scale)
+
+    def _create_surface(self, width, height):
+        surface, width, height = super()._create_surface(width, height)
+        if self.background is not None:
+            surface.get_data()[:] = self.background
+            surface.mark_dirty()
+        return surface, width, height
+
+# Rasterizes svg data with cairosvg, module level so it can be sent to worker processes
+def rasterize(data, scale, raw=False, background=None):
+    if not raw:
+        return cairosvg.svg2png(bytestring=data, scale=scale)
+    # Skip the png encoding, return the pixels of the cairo surface
+    tree = cairosvg.parser.Tree(bytestring=data)
+    surface = LayerSurface(tree, scale, background)
+    surface.cairo.flush()
+    return bytes(surface.cairo.get_data())
+
+# Divides the colors of raw pixels by their alpha, like cairo does when it
+# writes png images. Opaque frames are returned as they are, transparent
+# frames need numpy
+def unpremultiply(raster):
+    if raster[ALPHA_BYTE::4].count(255) == len(raster) // 4:
+        return raster
+    if numpy is None:
+        raise ImportError('Raw frames with transparent pixels need numpy, fill the scene or render png frames')
+    colors = [i for i in range(4) if i != ALPHA_BYTE]
+    pixels = numpy.frombuffer(raster, numpy.uint8).reshape(-1, 4)
+    alpha = pixels[:, ALPHA_BYTE:ALPHA_BYTE + 1].astype(numpy.uint32)
+    result = pixels.copy()
+    result[:, colors] = (pixels[:, colors].astype(numpy.uint32) * 255 + alpha // 2) // numpy.maximum(alpha, 1)
+    return result.tobytes()
+
+# Rasterizers turn drawings into png images or raw pixels (ARGB32)
+class Rasterizer():
+    version = None # Changes if rasters could change, see RasterCache
+
+    def rasterize(self, data, scale, raw=False, background=None): # From svg data
+        raise NotImplementedError
+
+    # Rasterizes the drawing, or a part of it (see Drawing.byteString).
+    # data is the serialized drawing, if it's already known
+    def rasterizeDrawing(self, drawing, scale, raw=False, background=None, viewBox=None, children=None, data=None):
+        if data is None:
+            data = drawing.byteString(viewBox, children)
+        return self.rasterize(data, scale, raw, background)
+
+class CairoSVGRasterizer(Rasterizer):
+    version = 'cairosvg ' + cairosvg.__version__
+
+    def rasterize(self, data, scale, raw=False, background=None):
+        return rasterize(data, scale, raw, background)
+
+# Draws the elements with cairo, without writing and parsing the drawing
+# (see canvas). Drawings it doesn't support are rasterized by cairosvg
+class CairoRasterizer(CairoSVGRasterizer):
+    def __init__(self):
+        from . import canvas # Loads pycairo, only when it's used
+        self.version = canvas.VERSION
+
+    def rasterize(self, data, scale, raw=False, background=None):
+        from . import canvas
+        try:
+            return canvas.rasterize(ET.fromstring(data), scale, raw, background)
+        except canvas.Unsupported:
+            return super().rasterize(data, scale, raw, background)
+
+    def rasterizeDrawing(self, drawing, scale, raw=False, background=None, viewBox=None, children=None, data=None):
+        from . import canvas
+        try:
+            return canvas.rasterize(drawing.node, scale, raw, background, viewBox,
+                None if children is None else [e.node for e in children], drawing.precision)
+        except canvas.Unsupported:
+            return super().rasterizeDrawing(drawing, scale, raw, background, viewBox, children, data)
+
+RASTERIZERS = {
+    'cairosvg': CairoSVGRasterizer,
+    'cairo': CairoRasterizer
+}
+
+def mergeTiles(tiles, limit=8): # Merges overlapping rectangles
+    merged = []
+    for tile in tiles:
+        i = 0
+        while i < len(merged):
+            other = merged[i]
+            if tile[0] < other[2] and other[0] < tile[2] and tile[1] < other[3] and other[1] < tile[3]:
+                tile = (
+                    min(tile[0], other[0]), min(tile[1], other[1]),
+                    max(tile[2], other[2]), max(tile[3], other[3]))
+                merged.pop(i)
+                i = 0
+            else:
+                i += 1
+        merged.append(tile)
+    if len(merged) > limit: # Every tile parses the whole scene
+        return mergeTiles([(
+            min(t[0] for t in merged), min(t[1] for t in merged),
+            max(t[2] for t in merged), max(t[3] for t in merged))])
+    return merged
+
+# Group that knows when its contents change
+class Layer(svg.Group):
+    def __init__(self, *elements):
+        self.modified = True
+        super().__init__(*elements)
+
+    def changed(self, element):
+        self.modified = True
+
+# An ffmpeg process, optionally fed by its own writer thread
+class Output():
+    def __init__(self, command, scale, fps, start=0, queueSize=0, raw=False):
+        self.command = command
+        self.raw = raw # Frames are raw pixels
+        self.process = None
+        self.scale = scale
+        self.fps = fps
+        self.start = start # First rendered frame of the output
+        self.queueSize = queueSize
+        self.error = None
+
+    def open(self):
+        self.process = subprocess.Popen(self.command, stdin=subprocess.PIPE)
+        self.queue = None
+        if self.queueSize > 0:
+            self.queue = queue.Queue(self.queueSize)
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    # Number of frames to write for rendered frames [first, first + frames),
+    # drops frames if the output frame rate is lower than the render frame rate
+    def count(self, first, frames, fps):
+        k = self.fps / fps
+        return int((first + frames - self.start) * k) - int((first - self.start) * k)
+
+    def run(self):
+        while True:
+            raster, frames = self.queue.get()
+            if raster is None:
+                return
+            if self.error is None: # Keep consuming frames after an error
+                try:
+                    self.pipe(raster, frames)
+                except Exception as error:
+                    self.error = error
+
+    def pipe(self, raster, frames):
+        if self.raw:
+            raster = unpremultiply(raster)
+        for frame in range(frames):
+            self.process.stdin.write(raster)
+
+    # Returns the time spent waiting for ffmpeg, or for room in the queue
+    def write(self, raster, frames=1):
+        if self.process is None:
+            self.open()
+        start = time.perf_counter()
+        if self.queue is None:
+            self.pipe(raster, frames)
+        else:
+            self.queue.put((raster, frames))
+        return time.perf_counter() - start
+
+    def close(self):
+        if self.process is None: # Nothing was written
+            return
+        if self.queue is not None:
+            self.queue.put((None, 0))
+            self.thread.join()
+        self.process.stdin.close()
+        self.process.wait()
+        if self.error is not None:
+            raise self.error
+
+# Rasters stored on disk by the hash of the scene, shared by every render.
+# Reading a raster updates its modification time, the least recently used
+# rasters are removed when the cache grows over maxSize
+class RasterCache():
+    def __init__(self, directory=CACHE_DIRECTORY, maxSize=CACHE_SIZE):
+        self.directory = directory
+        self.maxSize = maxSize
+        self.lock = threading.Lock() # Rasters of the process pool are stored from other threads
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(size for path, mtime, size in self.files())
+
+    def key(self, data, scale, raw=False, rasterizer=CairoSVGRasterizer.version):
+        version = '{} {} {}'.format(rasterizer, float(scale), 'raw' if raw else 'png')
+        return hashlib.sha1(version.encode() + b'\0' + data).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key[2:])
+
+    def files(self):
+        for entry in os.scandir(self.directory):
+            if entry.is_dir():
+                for file in os.scandir(entry.path):
+                    if file.is_file() and not file.name.endswith('.tmp'):
+                        stat = file.stat()
+                        yield file.path, stat.st_mtime, stat.st_size
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                raster = f.read()
+            os.utime(path)
+        except OSError:
+            self.stats['misses'] += 1
+            return None
+        self.stats['hits'] += 1
+        return raster
+
+    def put(self, key, raster):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temporary, 'wb') as f:
+            f.write(raster)
+        os.replace(temporary, path) # Other processes never read half written rasters
+        with self.lock:
+            self.stats['writes'] += 1
+            self.size += len(raster)
+            if self.size > self.maxSize:
+                self.evict()
+
+    def evict(self): # Removes the oldest rasters, down to 90% of the maximum size
+        files = sorted(self.files(), key=lambda f: f[1])
+        self.size = sum(f[2] for f in files)
+        for path, mtime, size in files:
+            if self.size <= 0.9 * self.maxSize:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.size -= size
+            self.stats['evictions'] += 1
+
+    def report(self):
+        total = self.stats['hits'] + self.stats['misses']
+        return 'Raster cache: {} hits, {} misses ({:.1%} hit rate), {:.1f} MB in {}.'.format(
+            self.stats['hits'], self.stats['misses'], self.stats['hits'] / total if total > 0 else 0,
+            self.size / (1 << 20), self.directory)
+
+# Numbered image files, encoded and written on a thread pool
+class Sequence(Output):
+    def __init__(self, pattern, scale, fps, start=0, size=None, workers=None):
+        super().__init__(None, scale, fps, start)
+        self.pattern = pattern
+        self.size = size # Size of raw frames, None if they are already encoded
+        self.workers = workers or os.cpu_count() or 1
+        self.index = None # Number of the next frame
+        self.pool = None
+        self.skipped = 0
+
+    def open(self):
+        directory = os.path.dirname(self.pattern)
+        if directory != '':
+            os.makedirs(directory, exist_ok=True)
+        self.hashes = {}
+        filename = os.path.join(directory, SEQUENCE_MANIFEST)
+        if os.path.exists(filename):
+            with open(filename) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError: # Cut short by an interrupted render
+                        continue
+                    self.hashes[entry['file']] = entry['hash']
+        self.manifest = open(filename, 'a')
+        self.lock = threading.Lock()
+        self.pool = concurrent.futures.ThreadPoolExecutor(self.workers)
+        self.jobs = collections.deque()
+
+    def count(self, first, frames, fps):
+        if self.index is None: # First frame written by this process
+            self.index = int((first - self.start) * self.fps / fps)
+        return super().count(first, frames, fps)
+
+    def encode(self, raster, digest, filenames):
+        if self.size is not None:
+            cairo = cairosvg.surface.cairo
+            surface = cairo.ImageSurface.create_for_data(
+                bytearray(raster), cairo.FORMAT_ARGB32, *self.size)
+            png = io.BytesIO()
+            surface.write_to_png(png)
+            raster = png.getvalue()
+        for filename in filenames:
+            with open(filename, 'wb') as f:
+                f.write(raster)
+        with self.lock:
+            for filename in filenames:
+                self.manifest.write(json.dumps({'file': os.path.basename(filename), 'hash': digest}) + '\n')
+            self.manifest.flush()
+
+    def write(self, raster, frames=1):
+        if self.pool is None:
+            self.open()
+        digest = hashlib.sha1(raster).hexdigest()
+        filenames = []
+        for index in range(self.index, self.index + frames):
+            filename = self.pattern % index
+            if self.hashes.get(os.path.basename(filename)) == digest and os.path.exists(filename):
+                self.skipped += 1
+            else:
+                filenames.append(filename)
+        self.index += frames
+        if len(filenames) > 0:
+            self.jobs.append(self.pool.submit(self.encode, raster, digest, filenames))
+
+        # Wait for the oldest frames if too many are in flight
+        start = time.perf_counter()
+        while len(self.jobs) > 0 and (self.jobs[0].done() or len(self.jobs) > 2 * self.workers):
+            self.jobs.popleft().result()
+        return time.perf_counter() - start
+
+    def close(self):
+        if self.pool is None: # Nothing was written
+            return
+        self.pool.shutdown()
+        self.manifest.close()
+        while len(self.jobs) > 0:
+            self.jobs.popleft().result()
+
+# Measurements of every written frame and of every play() call
+class Telemetry():
+    PHASES = ('animation', 'serialization', 'rasterization', 'pipe')
+
+    def __init__(self):
+        self.frames = []
+        self.plays = []
+        self.callbacks = [] # Called with the record of every written frame
+        self.actions = {}   # Time spent in the actions of the current play() call
+        self.current = None # Index of the current play() call
+
+    def frame(self, record):
+        self.frames.append(record)
+        for callback in self.callbacks:
+            callback(record)
+
+    def startPlay(self, comment, frames, runTime):
+        self.actions = {}
+        self.current = len(self.plays)
+        self.plays.append({'comment': comment, 'frames': frames, 'runTime': runTime, 'actions': self.actions})
+
+    def endPlay(self):
+        self.actions = {}
+        self.current = None
+
+    def totals(self, records):
+        totals = dict.fromkeys(self.PHASES, 0)
+        totals.update(frames=0, stall=0, svgBytes=0, rasterBytes=0)
+        for record in records:
+            for key in totals:
+                totals[key] += record[key]
+        return totals
+
+    # Totals of every play() call, with its slowest animation actions
+    def playSummary(self, index, slowest=5):
+        play = self.plays[index]
+        summary = self.totals(r for r in self.frames if r['play'] == index)
+        summary.update(comment=play['comment'], runTime=play['runTime'])
+        actions = sorted(play['actions'].items(), key=lambda a: a[1], reverse=True)
+        summary['slowest'] = [{'action': a, 'seconds': t} for a, t in actions[:slowest]]
+        return summary
+
+    def summary(self, slowest=5):
+        summary = self.totals(self.frames)
+        summary['plays'] = [self.playSummary(i, slowest) for i in range(len(self.plays))]
+        return summary
+
+    def export(self, filename):
+        with open(filename, 'w') as f:
+            json.dump({'summary': self.summary(), 'frames': self.frames}, f, indent=2)
 
 class Render():
-    def __init__(self, width, height, fps=30, scale=1, title=None):
+    def __init__(self, width, height, fps=30, scale=1, title=None, workers=0, raw=False, queueSize=0, dirtyRegions=False, preview=None, cache=None, rasterizer='cairosvg'):
         self.scene = svg.Drawing(width, height)
 
         self.width = width
@@ -26,27 +460,135 @@ class Render():
         self.title = title
         self.frames = 0
 
-        self.processes = {}
+        self.outputs = {}
+        self.queueSize = queueSize # Frames buffered for each output, 0 writes synchronously
         self.fps = fps
         self.scale = scale
+        self.raw = raw or dirtyRegions # Pipe raw pixels instead of png images
+
+        # Fast, low quality outputs. Animations still run at the full frame rate
+        if preview is None:
+            preview = os.environ.get(PREVIEW_VARIABLE, '') not in ('', '0')
+        self.preview = preview
+
+        # Last rasterized scene for each scale, reused if the scene doesn't change
+        self.lastRasters = {}
+        self.stats = {'rasterized': 0, 'reused': 0, 'cached': 0, 'partial': 0}
+
+        # Turns frames into pixels, a name in RASTERIZERS or a Rasterizer
+        if isinstance(rasterizer, str):
+            rasterizer = RASTERIZERS[rasterizer]()
+        self.rasterizer = rasterizer
+
+        # Rasters of previous renders, on disk. True uses CACHE_DIRECTORY
+        if cache is True:
+            cache = RasterCache()
+        elif isinstance(cache, str):
+            cache = RasterCache(cache)
+        self.cache = cache
+
+        # Timings and sizes of every frame, see onFrame
+        self.telemetry = Telemetry()
+        self.animationTime = 0 # Spent evaluating animations since the last frame
+
+        # Only rasterize the areas of the scene that changed since the last raster
+        self.dirtyRegions = dirtyRegions
+        self.scene.tracking = dirtyRegions
+        self.regions = {}
+
+        # Elements that don't change, rasterized once for each scale
+        self.static = Layer()
+        self.staticRasters = {}
 
-    def start(self, filename):
+        # Rasterize frames on a process pool, frames are written in order
+        self.pool = None
+        self.pending = collections.deque()
+        if workers > 0:
+            # Workers are forked (scripts don't need a __main__ guard) and started
+            # right away, before they can inherit the pipes of ffmpeg processes
+            context = multiprocessing.get_context('fork')
+            self.pool = concurrent.futures.ProcessPoolExecutor(workers, mp_context=context)
+            self.pool.submit(int).result()
+            self.backlog = 2 * workers
+
+        # Frames [first, last) rendered by this process, see renderSegments
+        self.segment = None
+        self.started = []
+        if SEGMENT_VARIABLE in os.environ:
+            self.segment = tuple(map(int, os.environ[SEGMENT_VARIABLE].split(':')))
+        if MANIFEST_VARIABLE in os.environ:
+            atexit.register(self.writeManifest, os.environ[MANIFEST_VARIABLE])
+
+    def start(self, filename, scale=None, fps=None):
         self.running = True
+        self.flush()
+        if scale is None:
+            scale = self.scale
+        if fps is None:
+            fps = self.fps
+        if self.preview:
+            scale *= PREVIEW_SCALE
+            fps *= PREVIEW_FPS
+
+        # Image sequences are numbered globally, segments don't need their own files
+        extension = os.path.splitext(filename)[1].lower()
+        if '%' in filename and extension in SEQUENCE_FORMATS:
+            if extension == '.svg':
+                scale = None # Frames aren't rasterized
+            size = self.frameSize(scale) if self.raw and scale is not None else None
+            self.outputs[filename] = Sequence(filename, scale, fps, self.frames, size)
+            return
 
         command = [ FFMPEG_BIN,
             '-hide_banner',
             '-loglevel', 'error',
-            '-y', # Overwrite output file if it exists
+            '-y'] # Overwrite output file if it exists
+        if self.raw:
+            command += [
+                '-f', 'rawvideo',
+                '-pix_fmt', PIXEL_FORMAT,
+                '-s', '{}x{}'.format(*self.frameSize(scale))]
+        command += [
             #'-f', 'image2pipe',
-            '-r', str(self.fps),
-            '-i', '-', # The input comes from a pipe
-            '-pix_fmt', 'yuv420p',
-            '-vcodec', 'libx264',
-            '-b:v', '500k', 
-            filename]
-        self.processes[filename] = subprocess.Popen(command, stdin=subprocess.PIPE)
+            '-r', str(fps),
+            '-i', '-'] # The input comes from a pipe
+        if extension in ANIMATED_FORMATS:
+            command += animationArguments(extension)
+        else:
+            command += [
+                '-pix_fmt', 'yuv420p',
+                '-vcodec', 'libx264',
+                '-b:v', '500k']
+            if self.preview:
+                command += ['-preset', 'ultrafast']
+        command += [filename if self.segment is None else segmentFile(filename, self.segment[2])]
+        if FFMPEG_BIN is None:
+            command = [sys.executable, '-c', NULL_SINK]
+        output = Output(command, scale, fps, self.frames, self.queueSize, self.raw)
+        if self.segment is None:
+            output.open()
+        else: # Only opened if the segment has frames for this output
+            self.started.append(filename)
+        self.outputs[filename] = output
+
+    def inSegment(self, frame=None):
+        if self.segment is None:
+            return True
+        if frame is None:
+            frame = self.frames
+        first, last, index, segments = self.segment
+        return first <= frame < last or (index == segments - 1 and frame >= last)
+
+    def writeManifest(self, filename):
+        with open(filename, 'w') as f:
+            json.dump({'frames': self.frames, 'outputs': self.started}, f)
 
 
+    def frameSize(self, scale=None): # Size of rasterized frames, in pixels
+        if scale is None:
+            scale = self.scale
+        return int(round(self.width * scale)), int(round(self.height * scale))
+
     def add(self, *elements): # Add svg elements, don't render them
         self.scene.add(*elements)
         return self
@@ -55,13 +597,182 @@ class Render():
         self.scene.remove(*elements)
         return self
 
+    # Mark svg elements that don't change, they are rasterized once and reused
+    # until they change. Only the bottom of the scene can be static, so that
+    # the cached raster is always below the rest of the scene (raw frames only)
+    def addStatic(self, *elements):
+        if not self.raw:
+            raise ValueError('Static elements are only cached for raw frames')
+        for e in elements:
+            bottom = 0 if self.static.parent is None else 1
+            if e.parent is self.scene and self.scene.children.index(e) == bottom:
+                self.scene.remove(e)
+            elif e.parent is not None or len(self.scene.children) > bottom:
+                raise ValueError('Static elements must be below every other element of the scene')
+            if self.static.parent is None:
+                self.scene.insert(0, self.static)
+            self.static.add(e)
+        return self
+
+    def removeStatic(self, *elements):
+        self.static.remove(*elements)
+        return self
+
+    def frameCounts(self, frames = 1): # Frames written to each output
+        first = self.frames
+        if self.segment is not None:
+            first = max(first, self.segment[0])
+            frames = max(0, min(self.frames + frames, self.segment[1]) - first)
+        counts = {}
+        for filename, output in self.outputs.items():
+            counts[filename] = output.count(first, frames, self.fps)
+        return counts
+
+    def onFrame(self, callback): # Calls callback with the telemetry record of every frame
+        self.telemetry.callbacks.append(callback)
+        return self
+
     def writeFrame(self, frames = 1):
-        raster = cairosvg.svg2png(bytestring=self.scene.byteString(), scale=self.scale) * frames
-        for filename, process in self.processes.items():
-            process.stdin.write(raster)
+        record = dict.fromkeys(Telemetry.PHASES, 0)
+        record.update(frame=self.frames, frames=frames, play=self.telemetry.current,
+            animation=self.animationTime, stall=0, svgBytes=0, elements=0, rasterBytes=0)
+        self.animationTime = 0
+        counts = self.frameCounts(frames)
+
+        # Rasterize once for every scale used by the outputs
+        rasters = {}
+        scales = set(self.outputs[f].scale for f in counts if counts[f] > 0)
+        if self.dirtyRegions:
+            changes = self.scene.changes()
+            for scale, areas in self.regions.items():
+                if areas is not None:
+                    self.regions[scale] = None if changes is None else areas + changes
+        if len(scales) > 0:
+            start = time.perf_counter()
+            data = self.scene.byteString()
+            record['serialization'] = time.perf_counter() - start
+            record['svgBytes'] = len(data)
+            record['elements'] = data.count(b'<') - data.count(b'</') # < is escaped in text and attributes
+
+            start = time.perf_counter()
+            digest = hashlib.sha1(data).digest()
+            for scale in scales:
+                rasters[scale] = data if scale is None else self.getRaster(data, digest, scale)
+            record['rasterization'] = time.perf_counter() - start
+
+        if self.pool is None:
+            self.writeRasters(rasters, counts, record)
+        else:
+            self.pending.append((rasters, counts, record))
+            self.flush(self.backlog)
         self.frames += frames
 
+    def getRaster(self, data, digest, scale):
+        last = self.lastRasters.get(scale)
+        if self.dirtyRegions:
+            areas = self.regions.get(scale)
+            self.regions[scale] = []
+        if last is not None and last[0] == digest:
+            self.stats['reused'] += 1
+            return last[1]
+
+        if self.cache is not None:
+            key = self.cache.key(data, scale, self.raw, self.rasterizer.version)
+            raster = self.cache.get(key)
+            if raster is not None:
+                self.lastRasters[scale] = (digest, raster)
+                self.stats['cached'] += 1
+                return raster
+
+        if self.pool is not None:
+            raster = self.pool.submit(self.rasterizer.rasterize, data, scale, self.raw)
+            if self.cache is not None:
+                def store(future, key=key):
+                    if future.exception() is None:
+                        self.cache.put(key, future.result())
+                raster.add_done_callback(store)
+        elif self.dirtyRegions and last is not None and areas is not None:
+            raster = self.updateRaster(data, last[1], areas, scale)
+        else:
+            raster = self.rasterizeScene(data, scale)
+        if self.cache is not None and self.pool is None:
+            self.cache.put(key, raster)
+        self.lastRasters[scale] = (digest, raster)
+        self.stats['rasterized'] += 1
+        return raster
+
+    def rasterizeScene(self, data, scale):
+        if not self.raw or len(self.static.children) == 0:
+            return self.rasterizer.rasterizeDrawing(self.scene, scale, self.raw, data=data)
+
+        if self.static.modified:
+            self.staticRasters = {}
+            self.static.modified = False
+        if scale not in self.staticRasters:
+            self.staticRasters[scale] = self.rasterizer.rasterizeDrawing(self.scene, scale, True, children=[self.static])
+        dynamic = [e for e in self.scene.children if e is not self.static]
+        return self.rasterizer.rasterizeDrawing(self.scene, scale, True, self.staticRasters[scale], children=dynamic)
+
+    # Rasterizes the areas of the scene that changed on top of the previous raster
+    def updateRaster(self, data, raster, areas, scale):
+        width, height = self.frameSize(scale)
+        origin = self.scene.min
+        tiles = []
+        for x0, y0, x1, y1 in areas:
+            # Pixels covered by the area, with room for antialiasing
+            x0 = max(0, math.floor((x0 - origin.x) * scale) - 1)
+            y0 = max(0, math.floor((y0 - origin.y) * scale) - 1)
+            x1 = min(width, math.ceil((x1 - origin.x) * scale) + 1)
+            y1 = min(height, math.ceil((y1 - origin.y) * scale) + 1)
+            if x0 < x1 and y0 < y1:
+                tiles.append((x0, y0, x1, y1))
+        tiles = mergeTiles(tiles)
+        if sum((t[2] - t[0]) * (t[3] - t[1]) for t in tiles) > width * height / 2:
+            return self.rasterizeScene(data, scale)
+
+        raster = bytearray(raster)
+        for x0, y0, x1, y1 in tiles:
+            viewBox = (origin.x + x0 / scale, origin.y + y0 / scale, (x1 - x0) / scale, (y1 - y0) / scale)
+            tile = self.rasterizer.rasterizeDrawing(self.scene, scale, True, viewBox=viewBox)
+            row = 4 * (x1 - x0)
+            for y in range(y0, y1):
+                start = 4 * (y * width + x0)
+                raster[start:start + row] = tile[(y - y0) * row:(y - y0 + 1) * row]
+        self.stats['partial'] += 1
+        return raster
+
+    def writeRasters(self, rasters, counts, record):
+        for scale, raster in rasters.items():
+            if isinstance(raster, concurrent.futures.Future):
+                start = time.perf_counter()
+                rasters[scale] = raster = raster.result()
+                record['rasterization'] += time.perf_counter() - start
+            if scale is not None:
+                record['rasterBytes'] += len(raster)
+
+        start = time.perf_counter()
+        for filename, count in counts.items():
+            if count > 0:
+                raster = rasters[self.outputs[filename].scale]
+                record['stall'] += self.outputs[filename].write(raster, count)
+        record['pipe'] = time.perf_counter() - start
+        self.telemetry.frame(record)
+
+    def flush(self, backlog=0): # Write rasterized frames in order
+        while len(self.pending) > backlog:
+            self.writeRasters(*self.pending.popleft())
+
+    @property
+    def hitRate(self): # Fraction of frames that reused the previous raster or a cached one
+        hits = self.stats['reused'] + self.stats['cached']
+        total = self.stats['rasterized'] + hits
+        if total == 0:
+            return 0
+        return hits / total
+
     def save(self, filename = None):
+        if not self.inSegment(): # Saved by another segment
+            return
         print('Saving File...')
         if filename == None:
             filename = 'frame-{}.svg'.format(self.frames)
@@ -71,7 +782,17 @@ class Render():
             if len(filename.split('.')) > 0:
                 extension = filename.split('.')[-1]
             if extension == 'png':
-                cairosvg.svg2png(bytestring=self.scene.byteString(), scale=self.scale, write_to=filename)
+                data = self.scene.byteString()
+                raster = None
+                if self.cache is not None:
+                    key = self.cache.key(data, self.scale, False, self.rasterizer.version)
+                    raster = self.cache.get(key)
+                if raster is None:
+                    raster = self.rasterizer.rasterizeDrawing(self.scene, self.scale, data=data)
+                    if self.cache is not None:
+                        self.cache.put(key, raster)
+                with open(filename, 'wb') as f:
+                    f.write(raster)
             else:
                 self.scene.write(filename)
 
@@ -85,12 +806,23 @@ class Render():
             print('Rendering {} frames ({} s)...'.format(frames, runTime))
         else:
             print('{} - Rendering {} frames ({} s)...'.format(comment, frames, runTime))
+        self.telemetry.startPlay(comment, frames, runTime)
         for frame in range(frames):
-            for o in objects:
-                o.animation.run(1 / self.fps)
+            # Frames of other segments aren't evaluated, the first frame of
+            # the segment seeks the animations to its time
+            if self.inSegment():
+                self.evaluate((frame + 1) / self.fps, *objects)
             self.writeFrame()
         for o in objects:
-            o.animation.reset()
+            o.animation.finish(self.telemetry.actions)
+        self.telemetry.endPlay()
+        return self
+
+    def evaluate(self, t, *objects): # Seeks the animations of objects to time t
+        start = time.perf_counter()
+        for o in objects:
+            o.animation.evaluate(t, self.telemetry.actions)
+        self.animationTime += time.perf_counter() - start
         return self
 
     def pause(self, time=1): # Pause animation
@@ -108,12 +840,80 @@ class Render():
         self.running = True
 
     def end(self, filename=None):
+        self.flush()
         if filename is None:
-            for filename, process in self.processes.items():
-                process.stdin.close()
-                process.wait()
-        elif filename in self.processes:
-            self.processes[filename].stdin.close()
-            self.processes[filename].wait()
-            self.processes.pop(filename)
+            for filename, output in self.outputs.items():
+                output.close()
+            if self.pool is not None:
+                self.pool.shutdown()
+        elif filename in self.outputs:
+            self.outputs.pop(filename).close()
         print('Done. {} frames ({:.2f} s @ {} fps) generated.'.format(self.frames, self.frames/self.fps, self.fps))
+        print('{} frames rasterized, {} reused, {} cached ({:.1%} hit rate).'.format(
+            self.stats['rasterized'], self.stats['reused'], self.stats['cached'], self.hitRate))
+        if self.cache is not None:
+            print(self.cache.report())
+
+
+# Output options of ffmpeg for animated images, looping forever
+def animationArguments(extension):
+    if extension == '.webp': # Frame deltas are computed by libwebp
+        return ['-vcodec', 'libwebp_anim', '-loop', '0']
+    palette = ("split[frames][sample];"
+        "[sample]select='not(mod(n,{}))',palettegen=stats_mode=diff[palette];"
+        "[frames][palette]paletteuse=diff_mode=rectangle").format(PALETTE_SAMPLING)
+    if extension == '.apng':
+        return ['-filter_complex', palette, '-plays', '0', '-f', 'apng']
+    return ['-filter_complex', palette, '-loop', '0']
+
+def segmentFile(filename, index):
+    root, extension = os.path.splitext(filename)
+    return '{}.part{}{}'.format(root, index, extension)
+
+# Renders a script on several processes, each one rendering a part of the
+# timeline, and joins the parts of every output with ffmpeg's concat demuxer
+def renderSegments(script, segments, python=sys.executable):
+    with tempfile.TemporaryDirectory() as directory:
+        # Count the frames without rendering them
+        manifest = os.path.join(directory, 'manifest.json')
+        environment = dict(os.environ)
+        environment[SEGMENT_VARIABLE] = '0:0:0:0'
+        environment[MANIFEST_VARIABLE] = manifest
+        subprocess.run([python, script], env=environment, check=True)
+        with open(manifest) as f:
+            manifest = json.load(f)
+        total = manifest['frames']
+
+        processes = []
+        for index in range(segments):
+            first = total * index // segments
+            last = total * (index + 1) // segments
+            environment = dict(os.environ)
+            environment[SEGMENT_VARIABLE] = '{}:{}:{}:{}'.format(first, last, index, segments)
+            processes.append(subprocess.Popen([python, script], env=environment))
+        for process in processes:
+            if process.wait() != 0:
+                raise subprocess.CalledProcessError(process.returncode, process.args)
+
+        for filename in manifest['outputs']:
+            parts = [segmentFile(filename, i) for i in range(segments)]
+            parts = [part for part in parts if os.path.exists(part)]
+            concat = os.path.join(directory, 'concat.txt')
+            with open(concat, 'w') as f:
+                for part in parts:
+                    f.write("file '{}'\n".format(os.path.abspath(part).replace("'", "'\\''")))
+            # Join the parts without encoding them again. Animated images are
+            # encoded again, so the whole animation uses the same palette
+            codec = ['-c', 'copy']
+            extension = os.path.splitext(filename)[1].lower()
+            if extension in ANIMATED_FORMATS:
+                codec = animationArguments(extension)
+            subprocess.run([FFMPEG_BIN,
+                '-hide_banner',
+                '-loglevel', 'error',
+                '-y',
+                '-f', 'concat',
+                '-safe', '0',
+                '-i', concat] + codec + [filename], check=True)
+            for part in parts:
+                os.remove(part)
@@ -1,7 +1,17 @@
 import math
+import numbers
+import re
+import array
 import xml.etree.ElementTree as ET
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 class Point3D():
+    __slots__ = ('x', 'y', 'z')
+
     def __init__(self, x, y, z):
         self.x = x
         self.y = y
@@ -90,7 +100,7 @@ class Point3D():
             )
 
     def dot(self, b):
-        return self.x * b.x + self.y * b.y + self.z * other.z
+        return self.x * b.x + self.y * b.y + self.z * b.z
     
     def cross(self, b):
         return Point3D(
@@ -117,6 +127,8 @@ class Point3D():
 
 
 class Point():
+    __slots__ = ('x', 'y')
+
     def __init__(self, x, y):
         self.x = x
         self.y = y
@@ -133,9 +145,8 @@ class Point():
     phase = angle
 
     def rotate(self, angle):
-        r = abs(self)
-        a = self.angle
-        return Point(r * math.cos(angle + a), r * math.sin(angle + a))
+        c, s = math.cos(angle), math.sin(angle)
+        return Point(self.x * c - self.y * s, self.x * s + self.y * c)
 
     def __add__(self, other):
         return Point(self.x + other.x, self.y + other.y)
@@ -172,70 +183,501 @@ class Point():
 
 
 class Polar(Point):
+    __slots__ = ()
+
     def __init__(self, r, angle):
         super().__init__(r * math.cos(angle), r * math.sin(angle))
 
 
+# Many points in a numpy array, one row per point. Arithmetic works like with a
+# single point (with numbers, points or arrays of one value per point).
+# Indexes and iteration give points, and .x, .y and .values the arrays of
+# every coordinate
+class Points():
+    __slots__ = ()
+    __array_ufunc__ = None # numpy arrays leave arithmetic with points to us
+
+    def __init__(self, points, *coordinates):
+        if numpy is None:
+            raise ImportError('{} needs numpy'.format(type(self).__name__))
+        if len(coordinates) > 0: # Arrays of every coordinate
+            values = numpy.column_stack(numpy.broadcast_arrays(points, *coordinates))
+        elif isinstance(points, Points):
+            values = points.values
+        elif isinstance(points, numpy.ndarray):
+            values = points
+        else:
+            values = [[p[i] for i in range(self.dimensions)] for p in points]
+        self.values = numpy.array(values, dtype=float).reshape(-1, self.dimensions)
+
+    @classmethod
+    def fromArray(cls, values): # Without copying values
+        points = object.__new__(cls)
+        points.values = values
+        return points
+
+    def operand(self, other): # Array that broadcasts with values
+        if isinstance(other, Points):
+            return other.values
+        if isinstance(other, (Point, Point3D)):
+            return numpy.array([other[i] for i in range(self.dimensions)], dtype=float)
+        other = numpy.asarray(other, dtype=float)
+        return other[:, None] if other.ndim == 1 else other
+
+    def __len__(self):
+        return len(self.values)
+
+    def point(self, index):
+        return self.single(*self.values[index].tolist())
+
+    def points(self):
+        return [self.single(*p) for p in self.values.tolist()]
+
+    def __getitem__(self, index): # A point, or the points of a slice
+        values = self.values[index]
+        if values.ndim == 1:
+            return self.single(*values.tolist())
+        return self.fromArray(values)
+
+    def __iter__(self):
+        return iter(self.points())
+
+    def __abs__(self):
+        return numpy.sqrt((self.values ** 2).sum(axis=1))
+
+    def unitVector(self):
+        return self / abs(self)
+
+    def __add__(self, other):
+        return self.fromArray(self.values + self.operand(other))
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return self.fromArray(self.values - self.operand(other))
+    def __rsub__(self, other):
+        return self.fromArray(self.operand(other) - self.values)
+    def __neg__(self):
+        return self.fromArray(-self.values)
+
+    def __mul__(self, other):
+        return self.fromArray(self.values * self.operand(other))
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        return self.fromArray(self.values / self.operand(other))
+
+    def __eq__(self, other):
+        return isinstance(other, Points) and numpy.array_equal(self.values, other.values)
+
+    def __str__(self):
+        return str(self.points())
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, self.values.tolist())
+
+class PointArray(Points, Point):
+    __slots__ = ('values',)
+    dimensions = 2
+    single = Point
+
+    x = property(lambda self: self.values[:, 0])
+    y = property(lambda self: self.values[:, 1])
+
+    @classmethod
+    def polar(cls, r, angle):
+        return cls(r * numpy.cos(angle), r * numpy.sin(angle))
+
+    @property
+    def angle(self):
+        return numpy.arctan2(self.y, self.x)
+    phase = angle
+
+    def rotate(self, angle): # One angle, or one for each point
+        c, s = numpy.cos(angle), numpy.sin(angle)
+        return PointArray(self.x * c - self.y * s, self.x * s + self.y * c)
+
+    def __mul__(self, other):
+        if isinstance(other, Point): # Dot products
+            return (self.values * self.operand(other)).sum(axis=1)
+        return Points.__mul__(self, other)
+    __rmul__ = __mul__
+
+class Point3DArray(Points, Point3D):
+    __slots__ = ('values',)
+    dimensions = 3
+    single = Point3D
+
+    x = property(lambda self: self.values[:, 0])
+    y = property(lambda self: self.values[:, 1])
+    z = property(lambda self: self.values[:, 2])
+
+    def matrix(self, matrix):
+        matrix = numpy.asarray(matrix, dtype=float)
+        values = self.values @ matrix[:3, :3].T
+        if matrix.shape[1] > 3: # Translation
+            values += matrix[:3, 3]
+        return Point3DArray.fromArray(values)
+
+    def to2D(self, d=None):
+        values = self.values[:, :2]
+        if d is not None:
+            values = values * (d / (d - self.z))[:, None]
+        return PointArray(values)
+
+    def azimuth(self):
+        return numpy.arctan2(self.y, self.x)
+
+    def elevation(self):
+        return numpy.arctan2(self.z, numpy.hypot(self.x, self.y))
+
+    def dot(self, b):
+        return (self.values * self.operand(b)).sum(axis=1)
+
+    def cross(self, b):
+        return Point3DArray.fromArray(numpy.cross(self.values, self.operand(b)))
+
+
+# Decimal digits of the numbers written in svg data (coordinates, lengths,
+# angles), the default of Drawing.precision. Numbers are kept as they are given
+# and rounded when the drawing is written. Factors of transforms, like scales,
+# keep more digits
+PRECISION = 2
+TRANSFORM_PRECISION = 5
+
+ADAPTIVE_DEPTH = 10 # Times a segment of an adaptive curve can be split
+
+# Shortest string of a number, rounded to digits decimal digits (PRECISION by default)
+def formatNumber(value, digits=None):
+    if type(value) is int:
+        return str(value)
+    string = '%.*f' % (PRECISION if digits is None else digits, value)
+    if '.' in string: # Trailing zeros
+        string = string.rstrip('0').rstrip('.')
+    return '0' if string == '-0' else string
+
+# Serialization, writes the same bytes as ET.tostring
+
+def escapeText(text):
+    if '&' in text:
+        text = text.replace('&', '&amp;')
+    if '<' in text:
+        text = text.replace('<', '&lt;')
+    if '>' in text:
+        text = text.replace('>', '&gt;')
+    return text
+
+def escapeAttribute(value):
+    value = escapeText(value)
+    if '"' in value:
+        value = value.replace('"', '&quot;')
+    if '\r' in value:
+        value = value.replace('\r', '&#13;')
+    if '\n' in value:
+        value = value.replace('\n', '&#10;')
+    if '\t' in value:
+        value = value.replace('\t', '&#09;')
+    return value
+
+# Attribute values are strings, numbers, PathData, PointsData or NumberData
+def formatValue(value, precision=None):
+    if type(value) is str:
+        return value
+    if type(value) is PathData or type(value) is PointsData or type(value) is NumberData:
+        return value.format(precision)
+    return formatNumber(value, precision)
+
+# Numbers are kept as int or float (numpy numbers too) so they are written by
+# formatNumber, anything else is stored as a string
+def attributeValue(value):
+    if type(value) in (int, float, str, PathData, PointsData, NumberData):
+        return value
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, numbers.Integral):
+        return int(value)
+    if isinstance(value, numbers.Real):
+        return float(value)
+    return str(value)
+
+def encode(string): # Characters outside ascii are written as references
+    return string.encode('ascii', 'xmlcharrefreplace')
+
+def startTag(tag, attributes, precision=None):
+    tag = '<' + tag
+    for key, value in attributes.items():
+        if type(value) is str:
+            value = escapeAttribute(value)
+        elif type(value) is PathData or type(value) is PointsData or type(value) is NumberData:
+            value = escapeAttribute(value.format(precision))
+        else: # Numbers don't need escaping
+            value = formatNumber(value, precision)
+        tag += ' ' + key + '="' + value + '"'
+    return tag
+
+# Attribute value made of text and numbers, like transforms. Every part is a
+# template filled with its values, written with the precision of the drawing
+# or their own digits
+class NumberData():
+    __slots__ = ('parts',)
+
+    def __init__(self, template='', values=(), digits=None):
+        self.parts = [(template, values, digits)]
+
+    def __add__(self, other): # other is a NumberData or a string
+        data = NumberData()
+        data.parts = self.parts + (other.parts if type(other) is NumberData else [(other, (), None)])
+        return data
+
+    def format(self, precision=None):
+        return ''.join(template.format(*[formatValue(v, precision if digits is None else digits) for v in values])
+            if len(values) > 0 else template for template, values, digits in self.parts)
+
+    def __str__(self):
+        return self.format()
+
+# Tag, attributes, text and children of an element. Numbers are stored as they
+# are given and only turned into strings when they are written. Has the parts
+# of the ElementTree interface used to read elements
+class Node():
+    __slots__ = ('tag', 'attrib', 'text', 'children')
+    tail = None
+
+    def __init__(self, tag):
+        self.tag = tag
+        self.attrib = {}
+        self.text = None
+        self.children = []
+
+    def get(self, key, default=None):
+        value = self.attrib.get(key)
+        if value is None:
+            return default
+        return formatValue(value)
+
+    def items(self, precision=None):
+        return [(key, formatValue(value, precision)) for key, value in self.attrib.items()]
+
+    def __iter__(self):
+        return iter(self.children)
+
+    def __len__(self):
+        return len(self.children)
+
+    def iter(self):
+        yield self
+        for child in self.children:
+            yield from child.iter()
+
+    def tree(self, precision=None): # Copy of the node and its children as ElementTree elements
+        element = ET.Element(self.tag, dict(self.items(precision)))
+        element.text = self.text
+        element.extend(child.tree(precision) for child in self.children)
+        return element
+
 class Element:
+    styled = None # See hasStyle
+
     def __init__(self, tag, attributes={}):
-        self.root = ET.Element(tag)
+        self.node = Node(tag)
+        self.parent = None
+        self.children = []
+        self.serialized = None # (precision, markup) of the element, until it or a descendant changes
         self.setAttributes(attributes)
 
+    # Copy of the element as an ElementTree element, changing it doesn't change the element
+    def toElementTree(self):
+        return self.node.tree()
+
+    @property
+    def root(self): # Read only, see toElementTree
+        return self.toElementTree()
+
     def add(self, *elements):
         for e in elements:
-            self.root.append(e.root)
+            self.node.children.append(e.node)
+            self.children.append(e)
+            e.parent = self
+            e.touch()
+        self.restructured()
+
+    def insert(self, index, element):
+        self.node.children.insert(index, element.node)
+        self.children.insert(index, element)
+        element.parent = self
+        element.touch()
+        self.restructured()
 
     def remove(self, *elements):
         for e in elements:
-            self.root.remove(e.root)
+            e.touch()
+            self.node.children.remove(e.node)
+            self.children.remove(e)
+            e.parent = None
+            e.styled = None
+        self.restructured()
+
+    # Must be called before the element changes, notifies the element
+    # and its ancestors (the drawing keeps track of the changed areas)
+    def touch(self):
+        e = self
+        while e is not None:
+            e.serialized = None
+            e.changed(self)
+            e = e.parent
+
+    def changed(self, element): # element is this element or a descendant
+        pass
 
     def setAttributes(self, attributes):
+        self.touch()
+        attrib = self.node.attrib
         for key, value in attributes.items():
-            if value is None:
-                value = 'none'
-            self.root.set(key, str(value))
+            attrib[key] = 'none' if value is None else attributeValue(value)
 
     def set(self, key, value):
-        self.root.set(key, str(value))
+        self.touch()
+        self.node.attrib[key] = attributeValue(value)
 
     def get(self, key):
-        return self.root.get(key)
+        return self.node.get(key)
 
     def __str__(self):
-        return ET.tostring(self.root, encoding='unicode')
+        return self.markup()
+
+    # Only the elements that changed since the last call (or written with
+    # another precision) are written again, the rest of the tree reuses its markup
+    def markup(self, precision=None):
+        if precision is None:
+            precision = PRECISION
+        if self.serialized is not None and self.serialized[0] == precision:
+            return self.serialized[1]
+        node = self.node
+        if '{' in node.tag or '{' in ''.join(node.attrib): # Namespaces
+            markup = ET.tostring(node.tree(precision), encoding='unicode')
+        else:
+            parts = [startTag(node.tag, node.attrib, precision)]
+            if node.text or len(self.children) > 0:
+                parts.append('>')
+                if node.text:
+                    parts.append(escapeText(node.text))
+                parts += [e.markup(precision) for e in self.children]
+                parts.append('</' + node.tag + '>')
+            else:
+                parts.append(' />')
+            markup = ''.join(parts)
+        self.serialized = (precision, markup)
+        return markup
+
+    def byteString(self):
+        return encode(self.markup())
+
+    def number(self, key):
+        return float(self.node.attrib.get(key))
+
+    def bounds(self): # (x0, y0, x1, y1) of the element's geometry, None if unknown
+        return None
+
+    # Area of the drawing covered by the element, including strokes,
+    # None if it can't be known without rendering the element
+    def renderBounds(self):
+        try:
+            bounds = self.bounds()
+        except (TypeError, ValueError, KeyError):
+            return None
+        if bounds is None or self.id is not None: # Might be cloned somewhere else
+            return None
+
+        stroke = None
+        strokeWidth = None
+        e = self
+        while True:
+            if 'transform' in e.node.attrib or e.node.tag in NON_RENDERED:
+                return None
+            if not UNBOUNDED.isdisjoint(e.node.attrib):
+                return None
+            if stroke is None:
+                stroke = e.get('stroke')
+            if strokeWidth is None:
+                strokeWidth = e.get('stroke-width')
+            if e.parent is None:
+                break
+            e = e.parent
+        if e.hasStyle(): # Css can change any element
+            return None
+
+        margin = 0
+        if stroke not in (None, 'none'):
+            try:
+                margin = 2 * float(strokeWidth or 1) # Room for miter joins
+            except ValueError:
+                return None
+        x0, y0, x1, y1 = bounds
+        return (x0 - margin, y0 - margin, x1 + margin, y1 + margin)
+
+    # Whether the tree of this root element has style elements, cached until
+    # elements are added or removed
+    def hasStyle(self):
+        if self.styled is None:
+            self.styled = any(node.tag == 'style' for node in self.node.iter())
+        return self.styled
+
+    def restructured(self):
+        e = self
+        while e is not None:
+            e.styled = None
+            e = e.parent
 
     def _setId(self, id):
-        self.root.set('id', id)
+        self.setAttributes({'id': id})
     def _getId(self):
-        return self.root.get('id')
+        return self.get('id')
 
     def _setClass(self, className):
-        self.root.set('class', className)
+        self.setAttributes({'class': className})
     def _getClass(self):
-        return self.root.get('class')
+        return self.get('class')
 
     id = property(_getId, _setId)
     className = property(_getClass, _setClass)
 
+# Elements whose children are not drawn where they are
+NON_RENDERED = ('defs', 'clipPath', 'mask', 'pattern', 'marker', 'symbol')
+
+# Attributes that can draw outside of the geometry of elements (or change it)
+UNBOUNDED = frozenset(('filter', 'style', 'class', 'mask', 'clip-path', 'marker',
+    'marker-start', 'marker-mid', 'marker-end'))
+
+def unionBounds(bounds):
+    if len(bounds) == 0 or None in bounds:
+        return None
+    return (
+        min(b[0] for b in bounds), min(b[1] for b in bounds),
+        max(b[2] for b in bounds), max(b[3] for b in bounds))
+
 
 class Style(Element):
     def __init__(self, style):
         super().__init__('style')
-        self.root.text = style
+        self.node.text = style
 
 class Drawing(Element):
-    def __init__(self, width, height, origin='default'):
+    tracking = False # Record the areas changed by elements
+
+    # precision is the number of decimal digits of the numbers written in the
+    # svg data, PRECISION by default
+    def __init__(self, width, height, origin='default', precision=None):
         super().__init__('svg')
         self.width = width
         self.height = height
+        self.precision = PRECISION if precision is None else precision
+        self.dirty = {} # Changed elements and their previous area
 
         viewBox = ''
         if origin == 'default':
-            viewBox = '0 0 {} {}'.format(width, height)
+            viewBox = NumberData('0 0 {} {}', (width, height))
             self.center = Point(width/2, height/2)
             self.min = Point(0, 0)
         elif origin == 'center':
-            viewBox = '{} {} {} {}'.format(-width/2, -height/2, width, height)
+            viewBox = NumberData('{} {} {} {}', (-width/2, -height/2, width, height))
             self.min = Point(-width/2, -height/2)
             self.center = Point(0, 0)
 
@@ -250,8 +692,37 @@ class Drawing(Element):
         self.add(background)
         return background
 
-    def byteString(self):
-        return ET.tostring(self.root)
+    def changed(self, element):
+        if self.tracking and element not in self.dirty:
+            self.dirty[element] = element.renderBounds()
+
+    # Areas changed since the last call, before and after the changes.
+    # None if an area is unknown
+    def changes(self):
+        areas = []
+        for element, bounds in self.dirty.items():
+            areas += [bounds, element.renderBounds()]
+        self.dirty = {}
+        if None in areas:
+            return None
+        return areas
+
+    def markup(self, precision=None):
+        return super().markup(self.precision if precision is None else precision)
+
+    # viewBox renders a part of the drawing, children a subset of its elements
+    def byteString(self, viewBox=None, children=None):
+        if viewBox is None and children is None:
+            return super().byteString()
+        attributes = dict(self.node.attrib)
+        if viewBox is not None: # Not rounded, tiles must line up with pixels
+            attributes['viewBox'] = '{} {} {} {}'.format(*viewBox)
+        if children is None:
+            children = self.children
+        if len(children) == 0:
+            return encode(startTag(self.node.tag, attributes, self.precision) + ' />')
+        return encode(''.join([startTag(self.node.tag, attributes, self.precision), '>'] +
+            [e.markup(self.precision) for e in children] + ['</' + self.node.tag + '>']))
 
     def write(self, filename):
         f = open(filename, 'w')
@@ -262,40 +733,44 @@ class Figure(Element):
     def __init__(self, tag, attributes={}):
         super().__init__(tag, attributes)
 
-    def transform(self, transformation):
-        t = self.root.get('transform')
-        if t is None:
-            t = ''
-        self.root.set('transform', t + transformation)
+    def transform(self, transformation): # A string or a NumberData
+        current = self.node.attrib.get('transform')
+        if current is not None:
+            if type(current) is not NumberData:
+                current = NumberData(current)
+            transformation = current + transformation
+        self.setAttributes({'transform': transformation})
         return self
 
     def clearTransform(self):
-        self.root.attrib.pop('transform', None)
+        self.touch()
+        self.node.attrib.pop('transform', None)
 
     def rotate(self, angle, x=None, y=None):
         a = math.degrees(angle)
         if x is None and y is None:
-            return self.transform('rotate({})'.format(a))
+            return self.transform(NumberData('rotate({})', (a,)))
         else:
-            return self.transform('rotate({} {} {})'.format(a, x, y))
+            return self.transform(NumberData('rotate({} {} {})', (a, x, y)))
     
     def translate(self, dx, dy=None):
         if dy is None:
-            return self.transform('translate({})'.format(dx))
-        return self.transform('translate({} {})'.format(dx, dy))
+            return self.transform(NumberData('translate({})', (dx,)))
+        return self.transform(NumberData('translate({} {})', (dx, dy)))
 
     def scale(self, kx, ky=None):
         if ky is None:
-            return self.transform('scale({})'.format(kx))
-        return self.transform('scale({} {})'.format(kx, ky))
+            return self.transform(NumberData('scale({})', (kx,), TRANSFORM_PRECISION))
+        return self.transform(NumberData('scale({} {})', (kx, ky), TRANSFORM_PRECISION))
 
     def matrix(self, a, b, c, d, e, f):
-        return self.transform('matrix({} {} {} {} {} {})'.format(a, b, c, d, e, f))
+        return self.transform(NumberData('matrix({} {} {} {} ', (a, b, c, d), TRANSFORM_PRECISION) +
+            NumberData('{} {})', (e, f)))
 
     def skewX(self, angle):
-        return self.transform('skewX({})'.format(math.degrees(angle)))
+        return self.transform(NumberData('skewX({})', (math.degrees(angle),)))
     def skewY(self, angle):
-        return self.transform('skewY({})'.format(math.degrees(angle)))
+        return self.transform(NumberData('skewY({})', (math.degrees(angle),)))
 
     def clone(self, x=0, y=0):
         use = Element('use')
@@ -310,26 +785,318 @@ class Circle(Figure):
         self.setAttributes({'cx': cx, 'cy': cy, 'r': r})
         self.setAttributes(attributes)
 
+    def bounds(self):
+        cx, cy, r = self.number('cx'), self.number('cy'), self.number('r')
+        return (cx - r, cy - r, cx + r, cy + r)
+
 class Ellipse(Figure):
     def __init__(self, cx, cy, rx, ry, attributes={}):
         super().__init__('ellipse')
         self.setAttributes({'cx': cx, 'cy': cy, 'rx': rx, 'ry': ry})
         self.setAttributes(attributes)
 
+    def bounds(self):
+        cx, cy = self.number('cx'), self.number('cy')
+        rx, ry = self.number('rx'), self.number('ry')
+        return (cx - rx, cy - ry, cx + rx, cy + ry)
+
+# Path data
+
+PATH_ARGUMENTS = {'m': 2, 'l': 2, 'h': 1, 'v': 1, 'c': 6, 's': 4, 'q': 4, 't': 2, 'a': 7, 'z': 0}
+PATH_TOKEN = re.compile(r'[A-Za-z]|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+def parsePath(d): # List of (command, arguments) in path data
+    commands = []
+    command = None
+    args = []
+    for token in PATH_TOKEN.findall(d):
+        if token.isalpha():
+            command = token
+            args = []
+            if PATH_ARGUMENTS[command.lower()] == 0:
+                commands.append((command, args))
+            continue
+        args.append(float(token))
+        if len(args) == PATH_ARGUMENTS[command.lower()]:
+            commands.append((command, args))
+            args = []
+            if command in 'Mm': # Extra coordinates are line commands
+                command = 'L' if command == 'M' else 'l'
+    return commands
+
+# Converts path commands to absolute M, L, C, Q, A and Z commands.
+# Z commands get the point where the subpath started
+def absolutePath(commands):
+    x, y = 0, 0
+    startX, startY = 0, 0
+    previous = None
+    result = []
+    for command, args in commands:
+        letter = command.upper()
+        dx, dy = (x, y) if command != letter else (0, 0)
+        if letter == 'H':
+            letter, args = 'L', [args[0] + dx, y]
+        elif letter == 'V':
+            letter, args = 'L', [x, args[0] + dy]
+        elif letter == 'A':
+            args = list(args[:5]) + [args[5] + dx, args[6] + dy]
+        elif letter == 'Z':
+            args = [startX, startY]
+        else:
+            args = [a + (dx if i % 2 == 0 else dy) for i, a in enumerate(args)]
+
+        # Smooth curves reflect the previous control point
+        if letter == 'S':
+            cx, cy = x, y
+            if previous is not None and previous[0] == 'C':
+                cx, cy = 2 * x - previous[1][2], 2 * y - previous[1][3]
+            letter, args = 'C', [cx, cy] + args
+        elif letter == 'T':
+            cx, cy = x, y
+            if previous is not None and previous[0] == 'Q':
+                cx, cy = 2 * x - previous[1][0], 2 * y - previous[1][1]
+            letter, args = 'Q', [cx, cy] + args
+
+        x, y = args[-2], args[-1]
+        if letter == 'M':
+            startX, startY = x, y
+        previous = (letter, args)
+        result.append(previous)
+    return result
+
+# Bounds of the path's points and control points, which contain its curves
+def pathBounds(commands):
+    xs, ys = [], []
+    x, y = 0, 0
+    for command, args in absolutePath(commands):
+        if command == 'A':
+            rx, ry = abs(args[0]), abs(args[1])
+            r = 0 # Zero radius arcs are straight lines
+            if min(rx, ry) > 0:
+                # Radii are scaled up if the ellipse doesn't fit the arc
+                chord = math.hypot(args[5] - x, args[6] - y)
+                r = max(rx, ry) * max(1, chord / (2 * min(rx, ry)))
+            xs += [args[5] - 2 * r, args[5] + 2 * r]
+            ys += [args[6] - 2 * r, args[6] + 2 * r]
+        elif command != 'Z':
+            xs += args[0::2]
+            ys += args[1::2]
+        x, y = args[-2], args[-1]
+    if len(xs) == 0:
+        return None
+    return (min(xs), min(ys), max(xs), max(ys))
+
+# Subset of points within tolerance of the line through all of them
+# (Ramer-Douglas-Peucker). Closed lines also return to the first point
+def simplifyPoints(points, tolerance, closed=False):
+    points = points.points() if isinstance(points, Points) else list(points)
+    if len(points) < 3:
+        return points
+    if closed: # Split at the farthest point from the first one
+        far = max(range(len(points)), key=lambda i: math.hypot(points[i][0] - points[0][0], points[i][1] - points[0][1]))
+        if far == 0:
+            return points[:1]
+        return simplifyPoints(points[:far + 1], tolerance)[:-1] + simplifyPoints(points[far:] + points[:1], tolerance)[:-1]
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        ax, ay = points[first][0], points[first][1]
+        dx, dy = points[last][0] - ax, points[last][1] - ay
+        length = dx * dx + dy * dy
+        worst, index = tolerance, None
+        for i in range(first + 1, last): # Distance to the segment from first to last
+            px, py = points[i][0] - ax, points[i][1] - ay
+            u = 0 if length == 0 else min(1, max(0, (px * dx + py * dy) / length))
+            distance = math.hypot(px - u * dx, py - u * dy)
+            if distance > worst:
+                worst, index = distance, i
+        if index is not None:
+            keep[index] = True
+            stack += [(first, index), (index, last)]
+    return [p for p, k in zip(points, keep) if k]
+
+# Cubic curves ([P0, P1, P2, P3] lists of Points) within tolerance of points, fitted by
+# least squares and split where they are too far (Schneider, "An Algorithm for
+# Automatically Fitting Digitized Curves")
+def fitCurve(points, tolerance):
+    points = [Point(p[0], p[1]) for p in points]
+    points = [p for i, p in enumerate(points) if i == 0 or p != points[i - 1]]
+    if len(points) < 2:
+        return []
+    curves = []
+    stack = [(0, len(points) - 1, (points[1] - points[0]).unitVector(), (points[-2] - points[-1]).unitVector())]
+    while stack: # Left parts first, curves are found in order
+        first, last, left, right = stack.pop()
+        curve, split = fitCubic(points[first:last + 1], left, right, tolerance)
+        if curve is not None:
+            curves.append(curve)
+            continue
+        split += first
+        center = points[split - 1] - points[split + 1]
+        if abs(center) == 0:
+            center = points[split - 1] - points[split]
+        center = center.unitVector()
+        stack += [(split, last, -center, right), (first, split, left, center)]
+    return curves
+
+def fitCubic(points, left, right, tolerance): # Curve, or None and where to split
+    if len(points) == 2:
+        d = abs(points[1] - points[0]) / 3
+        return [points[0], points[0] + d * left, points[1] + d * right, points[1]], None
+
+    lengths = [0]
+    for a, b in zip(points, points[1:]):
+        lengths.append(lengths[-1] + abs(b - a))
+    u = [l / lengths[-1] for l in lengths]
+    curve = bezierFit(points, u, left, right)
+    error, split = fitError(points, curve, u)
+    if error > 4 * tolerance:
+        return None, split
+    for i in range(4): # Close, better parameters can make it fit
+        if error <= tolerance:
+            return curve, None
+        u = [bezierRoot(curve, p, t) for p, t in zip(points, u)]
+        curve = bezierFit(points, u, left, right)
+        error, split = fitError(points, curve, u)
+    if error <= tolerance:
+        return curve, None
+    return None, split
+
+def bezierFit(points, u, left, right): # Least squares lengths of the tangents
+    P0, P3 = points[0], points[-1]
+    c00 = c01 = c11 = x0 = x1 = 0
+    for p, t in zip(points, u):
+        v = 1 - t
+        a1, a2 = left * (3 * v * v * t), right * (3 * v * t * t)
+        c00 += a1 * a1
+        c01 += a1 * a2
+        c11 += a2 * a2
+        rest = p - (P0 * (v**3 + 3 * v * v * t) + P3 * (3 * v * t * t + t**3))
+        x0 += a1 * rest
+        x1 += a2 * rest
+    determinant = c00 * c11 - c01 * c01
+    length = abs(P3 - P0)
+    alpha1 = alpha2 = 0
+    if determinant != 0:
+        alpha1 = (x0 * c11 - x1 * c01) / determinant
+        alpha2 = (c00 * x1 - c01 * x0) / determinant
+    if alpha1 < 1e-6 * length or alpha2 < 1e-6 * length:
+        alpha1 = alpha2 = length / 3
+    return [P0, P0 + alpha1 * left, P3 + alpha2 * right, P3]
+
+def fitError(points, curve, u): # Largest distance and its point
+    error, split = 0, len(points) // 2
+    for i in range(1, len(points) - 1):
+        distance = abs(bezierPoint(*curve, u[i]) - points[i])
+        if distance > error:
+            error, split = distance, i
+    return error, split
+
+def bezierRoot(curve, p, t): # Newton step to the parameter of the closest point to p
+    P0, P1, P2, P3 = curve
+    v = 1 - t
+    d1 = 3 * v * v * (P1 - P0) + 6 * v * t * (P2 - P1) + 3 * t * t * (P3 - P2)
+    d2 = 6 * v * (P2 - 2 * P1 + P0) + 6 * t * (P3 - 2 * P2 + P1)
+    q = bezierPoint(P0, P1, P2, P3, t) - p
+    denominator = d1 * d1 + q * d2
+    if denominator == 0:
+        return t
+    return t - (q * d1) / denominator
+
+# Format of every path command
+PATH_FORMATS = {
+    'M': 'M {} {}', 'L': 'L {} {}', 'H': 'H {}', 'V': 'V {}', 'Z': 'Z',
+    'C': 'C {} {}, {} {}, {} {}', 'S': 'S {} {}, {} {}', 'Q': 'Q {} {}, {} {}',
+    'T': 'T {} {}', 'A': 'A {} {} {} {} {} {} {}'
+}
+PATH_FORMATS.update({k.lower(): k.lower() + v[1:] for k, v in PATH_FORMATS.items()})
+
+# Value of the d attribute of paths. Commands are added to a list, as strings
+# or as (format, values, count) commands for every count values, and only
+# written when the path data is read or written
+class PathData():
+    __slots__ = ('parts', 'string', 'precision')
+
+    def __init__(self, d=''):
+        self.parts = [] if d == '' else [d]
+        self.string = None
+        self.precision = None
+
+    def append(self, command, values=(), count=None):
+        self.parts.append((command, values, len(values) if count is None else count))
+        self.string = None
+
+    def format(self, precision=None):
+        if precision is None:
+            precision = PRECISION
+        if self.string is None or self.precision != precision:
+            strings = []
+            for part in self.parts:
+                if type(part) is str:
+                    strings.append(part)
+                    continue
+                command, values, count = part
+                if len(values) == 0:
+                    strings.append(command)
+                    continue
+                values = [formatNumber(v, precision) for v in values]
+                for i in range(0, len(values), count):
+                    strings.append(command.format(*values[i:i + count]))
+            self.string = ''.join(strings)
+            self.precision = precision
+        return self.string
+
+    def __str__(self):
+        return self.format()
+
 class Path(Figure):
     def __init__(self, attributes={}):
         super().__init__('path', attributes)
-        self.d = ''
+        self.data = PathData()
+
+    def _getD(self):
+        return str(self.data)
+    def _setD(self, d):
+        self.data = PathData(d)
+        self.setPath()
+
+    d = property(_getD, _setD)
 
     def setPath(self):
-        self.root.set('d', self.d)
+        self.touch()
+        self.node.attrib['d'] = self.data
         return self
 
+    def bounds(self):
+        d = self.d
+        if d == '':
+            return None
+        return pathBounds(parsePath(d))
+
     def command(self, command, *args):
-        precision = 2 # Path precision
-        roundedArgs = [round(a, precision) for a in args]
-        self.d += command.format(*roundedArgs)
-        return self.setPath()
+        self.touch()
+        self.data.append(command, args)
+        self.node.attrib['d'] = self.data
+        return self
+
+    # Adds a command for every group of arguments in values, a flat sequence
+    # of numbers, a sequence of points or a PointArray. path.extend('L', points) draws
+    # lines to all of the points
+    def extend(self, letter, values):
+        count = PATH_ARGUMENTS[letter.lower()]
+        values = values.values.ravel().tolist() if isinstance(values, Points) else list(values)
+        if len(values) > 0 and not isinstance(values[0], numbers.Real): # Points
+            values = [c for point in values for c in (point[0], point[1])]
+        if count == 0 or len(values) % count != 0:
+            raise ValueError('{} needs groups of {} values'.format(letter, count))
+        self.touch()
+        if len(values) > 0:
+            self.data.append(PATH_FORMATS[letter], values, count)
+        self.node.attrib['d'] = self.data
+        return self
 
     def M(self, x, y):
         return self.command('M {} {}', x, y)
@@ -352,8 +1119,7 @@ class Path(Figure):
         return self.command('v {}', dy)
 
     def Z(self):
-        self.d += 'Z'
-        return self.setPath()
+        return self.command('Z')
 
     def C(self, cx1, cy1, cx2, cy2, x2, y2):
         return self.command('C {} {}, {} {}, {} {}', cx1, cy1, cx2, cy2, x2, y2)
@@ -367,7 +1133,7 @@ class Path(Figure):
     def Q(self, cx, cy, x, y):
         return self.command('Q {} {}, {} {}', cx, cy, x, y)
     def q(self, cdx1, cdy1, dx, dy):
-        return self.command('Q {} {} {} {}', cdx1, cdy1, dx, dy)
+        return self.command('q {} {}, {} {}', cdx1, cdy1, dx, dy)
     def T(self, x, y):
         return self.command('T {} {}', x, y)
     def t(self, dx, dy):
@@ -393,7 +1159,18 @@ class Path(Figure):
     def slice(self, cx, cy, rx, ry, startAngle, endAngle):
         return self.arc(cx, cy, rx, ry, startAngle, endAngle).L(cx, cy).Z()
 
-    def parametric(self, f, start, end, n, delta=1e-3):
+    # Cubic segments through n samples of f between start and end. Functions
+    # taking and returning numpy arrays (like lambda t: Point(numpy.cos(t), t))
+    # are evaluated once for all the samples. With a tolerance, segments are
+    # split until they are within tolerance pixels of f, rendered at renderScale
+    def parametric(self, f, start, end, n, delta=1e-3, tolerance=None, renderScale=1):
+        if tolerance is not None:
+            return self.adaptiveParametric(f, start, end, n, tolerance / renderScale, delta)
+        if numpy is not None:
+            samples = parametricSamples(f, start, end, n, delta)
+            if samples is not None:
+                return self.parametricArrays(*samples)
+
         inc = (end - start) / (n - 1)
         first = True
 
@@ -425,9 +1202,185 @@ class Path(Figure):
             except ValueError:
                 first = True
 
+    # Starts with n samples and splits the segments in half where the curve
+    # bends away from f, so straight parts get few segments and tight turns many
+    def adaptiveParametric(self, f, start, end, n, tolerance, delta=1e-3):
+        points = {}
+        drawn = [None] # Where the last segment ended
+
+        def point(t): # None where f isn't defined
+            if t not in points:
+                try:
+                    points[t] = samplePoint(f(t))
+                except ValueError:
+                    points[t] = None
+            return points[t]
+
+        def sample(t): # Point and derivative
+            P = point(t)
+            if P is None:
+                return None
+            try:
+                return P, (samplePoint(f(t + delta)) - P) / delta
+            except ValueError:
+                return None
+
+        def segment(a, A, b, B, depth):
+            h = b - a
+            if A is None or B is None:
+                if (A is None) != (B is None) and depth < ADAPTIVE_DEPTH: # Edge of the domain of f
+                    m = a + h / 2
+                    M = sample(m)
+                    segment(a, A, m, M, depth + 1)
+                    segment(m, M, b, B, depth + 1)
+                return
+            P0, P3 = A[0], B[0]
+            P1, P2 = P0 + A[1] * (h / 3), P3 - B[1] * (h / 3)
+            if depth < ADAPTIVE_DEPTH:
+                for u in (0.25, 0.5, 0.75):
+                    P = point(a + u * h)
+                    if P is None or abs(bezierPoint(P0, P1, P2, P3, u) - P) > tolerance:
+                        m = a + h / 2
+                        M = sample(m)
+                        segment(a, A, m, M, depth + 1)
+                        segment(m, M, b, B, depth + 1)
+                        return
+
+            try:
+                broken = B[1].y / B[1].x > 500 # Discontinuity, like in parametric
+            except ZeroDivisionError:
+                broken = True
+            if broken:
+                drawn[0] = None
+                return
+            if drawn[0] != a:
+                self.M(P0.x, P0.y)
+            self.C(P1.x, P1.y, P2.x, P2.y, P3.x, P3.y)
+            drawn[0] = b
+
+        inc = (end - start) / (n - 1)
+        a, A = start, sample(start)
+        for i in range(1, n):
+            b = start + i * inc
+            B = sample(b)
+            segment(a, A, b, B, 0)
+            a, A = b, B
+        return self
+
+    # Replaces the path with fewer segments within tolerance pixels of it, rendered
+    # at renderScale: lines or, if smooth, cubic curves fitted to it. Subpaths
+    # with arcs are kept
+    def simplify(self, tolerance=0.5, smooth=False, renderScale=1):
+        tolerance /= renderScale
+        subpaths = []
+        for command, args in absolutePath(parsePath(self.d)):
+            if command == 'M':
+                subpaths.append([('M', args)])
+                continue
+            if len(subpaths) == 0:
+                subpaths.append([('M', [0, 0])])
+            subpaths[-1].append((command, args))
+            if command == 'Z': # Following commands start where the subpath started
+                subpaths.append([('M', args)])
+
+        self.clear()
+        for subpath in subpaths:
+            commands = subpath[1:]
+            if any(command == 'A' for command, args in commands):
+                self.M(*subpath[0][1])
+                for command, args in commands:
+                    self.command(PATH_FORMATS[command], *args)
+                continue
+
+            points = [Point(*subpath[0][1])]
+            for command, args in commands:
+                if command in 'CQ': # Flattened
+                    controls = [points[-1]] + [Point(*args[i:i + 2]) for i in range(0, len(args), 2)]
+                    if command == 'Q':
+                        P0, Q1, P3 = controls
+                        controls = [P0, P0 + (Q1 - P0) * (2 / 3), P3 + (Q1 - P3) * (2 / 3), P3]
+                    length = sum(abs(b - a) for a, b in zip(controls, controls[1:]))
+                    steps = min(100, int(math.sqrt(length / tolerance)) + 1)
+                    points += [bezierPoint(*controls, i / steps) for i in range(1, steps + 1)]
+                elif command != 'M':
+                    points.append(Point(*args))
+            closed = commands[-1][0] == 'Z' if len(commands) > 0 else False
+            if len(points) < 2:
+                continue
+
+            self.M(points[0].x, points[0].y)
+            if smooth:
+                for P0, P1, P2, P3 in fitCurve(points, tolerance):
+                    self.C(P1.x, P1.y, P2.x, P2.y, P3.x, P3.y)
+            else:
+                points = simplifyPoints(points, tolerance)
+                if closed and points[-1] == points[0]: # Drawn by Z
+                    points.pop()
+                self.extend('L', points[1:])
+            if closed:
+                self.Z()
+        return self
+
+    # Same segments as the loop in parametric, from the arrays of the samples
+    # and of their derivatives
+    def parametricArrays(self, x, y, dx, dy):
+        with numpy.errstate(all='ignore'):
+            valid = numpy.isfinite(x) & numpy.isfinite(y) & numpy.isfinite(dx) & numpy.isfinite(dy)
+            broken = (dx == 0) | (dy / dx > 500) # Discontinuities
+            x1, y1 = x + dx / 3, y + dy / 3
+            x2, y2 = x - dx / 3, y - dy / 3
+        drawn = valid[:-1] & valid[1:] & ~broken[1:]
+        segments = numpy.flatnonzero(drawn).tolist()
+        if len(segments) == 0:
+            return
+        starts = set(numpy.flatnonzero(drawn & ~numpy.concatenate(([False], drawn[:-1]))).tolist())
+
+        X, Y, X1, Y1 = x.tolist(), y.tolist(), x1.tolist(), y1.tolist()
+        X2, Y2 = x2.tolist(), y2.tolist()
+        M, C, S = PATH_FORMATS['M'], PATH_FORMATS['C'], PATH_FORMATS['S']
+
+        self.touch()
+        for i in segments:
+            if i in starts:
+                self.data.append(M, (X[i], Y[i]))
+                self.data.append(C, (X1[i], Y1[i], X2[i + 1], Y2[i + 1], X[i + 1], Y[i + 1]))
+            else:
+                self.data.append(S, (X2[i + 1], Y2[i + 1], X[i + 1], Y[i + 1]))
+        self.node.attrib['d'] = self.data
+
     def clear(self):
-        self.d = ''
-        self.root.attrib.pop('d', None)
+        self.touch()
+        self.data = PathData()
+        self.node.attrib.pop('d', None)
+
+
+# Point of a cubic bezier curve at u, from 0 to 1
+def bezierPoint(P0, P1, P2, P3, u):
+    v = 1 - u
+    return v**3 * P0 + 3 * v**2 * u * P1 + 3 * v * u**2 * P2 + u**3 * P3
+
+def samplePoint(value): # Point returned by a function, also as a PointArray of one point
+    if isinstance(value, Points):
+        return value.point(0)
+    return Point(*value)
+
+# Samples of f at n values of t between start and end, with their derivatives:
+# arrays x, y, dx, dy. None if f doesn't take arrays
+def parametricSamples(f, start, end, n, delta):
+    inc = (end - start) / (n - 1)
+    t = start + numpy.arange(n) * inc
+    try:
+        with numpy.errstate(all='ignore'):
+            p, q = f(t), f(t + delta)
+            if not isinstance(p, Point): # Pairs of arrays
+                p, q = Point(*p), Point(*q)
+            x, y, qx, qy = (numpy.asarray(v, dtype=float) for v in (p.x, p.y, q.x, q.y))
+    except Exception: # Functions of numbers, like math.sin
+        return None
+    if any(v.shape != t.shape for v in (x, y, qx, qy)):
+        return None
+    k = inc / delta
+    return x, y, k * (qx - x), k * (qy - y)
 
 
 class Line(Figure):
@@ -436,6 +1389,11 @@ class Line(Figure):
         self.setAttributes({'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2})
         self.setAttributes(attributes)
 
+    def bounds(self):
+        x1, y1 = self.number('x1'), self.number('y1')
+        x2, y2 = self.number('x2'), self.number('y2')
+        return (min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+
 
 class Rect(Figure):
     def __init__(self, x, y, w, h, attributes={}):
@@ -447,35 +1405,87 @@ class Rect(Figure):
             ry = rx
         self.setAttributes({'rx': rx, 'ry': ry})
 
+    def bounds(self):
+        x, y = self.number('x'), self.number('y')
+        return (x, y, x + self.number('width'), y + self.number('height'))
+
+# Value of the points attribute of polygons and polylines. Coordinates are kept
+# in a packed array (x0, y0, x1, y1...) and only written when they are read
+class PointsData():
+    __slots__ = ('coordinates', 'string', 'precision')
+
+    def __init__(self, points):
+        if isinstance(points, PointArray):
+            self.coordinates = array.array('d', points.values.tobytes())
+        else:
+            self.coordinates = array.array('d', [c for p in points for c in (p[0], p[1])])
+        self.string = None
+        self.precision = None
+
+    def __len__(self):
+        return len(self.coordinates) // 2
+
+    def center(self):
+        sides = len(self)
+        return Point(sum(self.coordinates[0::2]) / sides, sum(self.coordinates[1::2]) / sides)
+
+    def bounds(self):
+        xs, ys = self.coordinates[0::2], self.coordinates[1::2]
+        return (min(xs), min(ys), max(xs), max(ys))
+
+    def format(self, precision=None):
+        if precision is None:
+            precision = PRECISION
+        if self.string is None or self.precision != precision:
+            values = [formatNumber(c, precision) for c in self.coordinates]
+            self.string = ' '.join(map(','.join, zip(values[0::2], values[1::2])))
+            self.precision = precision
+        return self.string
+
+    def __str__(self):
+        return self.format()
+
 class Polygon(Figure):
     def __init__(self, points, attributes={}):
         super().__init__('polygon')
         self.points = points
         self.setAttributes(attributes)
 
+    # Average of the vertices, cached until the points change
     @property
     def center(self):
-        c = Point(0, 0)
-        sides = len(self.points)
-        for p in self.points:
-            c.x += p[0]
-            c.y += p[1]
-        return c / sides
+        if self._center is None:
+            self._center = self.data.center()
+        return Point(self._center.x, self._center.y)
 
+    def bounds(self):
+        if self._bounds is None:
+            self._bounds = self.data.bounds()
+        return self._bounds
 
     def _setPoints(self, points):
         if len(points) < 3:
             raise ValueError('Polygons must have at least three sides.')
 
         self._points = points
-        pointsString = ' '.join(list(map(lambda p: '{},{}'.format(p[0], p[1]), points)))
-        self.setAttributes({'points': pointsString})
+        self._center = self._bounds = None
+        self.data = PointsData(points)
+        self.touch()
+        self.node.attrib['points'] = self.data
 
     def _getPoints(self):
         return self._points
 
     points = property(_getPoints, _setPoints)
 
+    # Removes the points within tolerance pixels (at renderScale) of the lines
+    # between the rest
+    def simplify(self, tolerance=0.5, renderScale=1):
+        points = simplifyPoints(self.points, tolerance / renderScale, closed=True)
+        if len(points) >= 3:
+            self.points = points
+        return self
+
 class RegularPolygon(Polygon):
     def __init__(self, cx, cy, px, py, sides, attributes = {}):
         v = Point(px - cx, py - cy)
@@ -491,16 +1501,38 @@ class RegularPolygon(Polygon):
 
 class Polyline(Figure):
     def __init__(self, points, attributes={}):
-        super().__init('polyline')
-        pointsString = ' '.join(list(map(lambda p: '{},{}'.format(p.x, p.y), points)))
-        self.setAttributes({'points': pointsString})
+        super().__init__('polyline')
+        self.points = points
         self.setAttributes(attributes)
 
+    def bounds(self):
+        return self.data.bounds()
+
+    def _setPoints(self, points):
+        self._points = points
+        self.data = PointsData(points)
+        self.touch()
+        self.node.attrib['points'] = self.data
+
+    def _getPoints(self):
+        return self._points
+
+    points = property(_getPoints, _setPoints)
+
+    # Removes the points within tolerance pixels (at renderScale) of the lines
+    # between the rest
+    def simplify(self, tolerance=0.5, renderScale=1):
+        self.points = simplifyPoints(self.points, tolerance / renderScale)
+        return self
+
 class Group(Figure):
     def __init__(self, *elements):
         super().__init__('g')
         self.add(*elements)
 
+    def bounds(self):
+        return unionBounds([e.renderBounds() for e in self.children])
+
 
 class ClipPath(Figure):
     def __init__(self, identifier, *elements):
@@ -522,21 +1554,21 @@ class Text(Figure):
 
     def align(self, mode):
         if mode == 'left' or mode == 'start':
-            self.root.set('text-anchor', 'start')
+            self.setAttributes({'text-anchor': 'start'})
         elif mode == 'right' or mode == 'end':
-            self.root.set('text-anchor', 'end')
+            self.setAttributes({'text-anchor': 'end'})
         elif mode == 'center' or mode == 'middle':
-            self.root.set('text-anchor', 'middle')
+            self.setAttributes({'text-anchor': 'middle'})
         self.set_text(self.text)
         return self
 
     def baseline(self, mode):
         if mode == 'top':
-            self.root.set('dominant-baseline', 'auto')
+            self.setAttributes({'dominant-baseline': 'auto'})
         elif mode == 'middle' or mode == 'center':
-            self.root.set('dominant-baseline', 'middle')
+            self.setAttributes({'dominant-baseline': 'middle'})
         elif mode == 'bottom':
-            self.root.set('dominant-baseline', 'hanging')
+            self.setAttributes({'dominant-baseline': 'hanging'})
         return self
 
     def get_text(self):
@@ -546,13 +1578,12 @@ class Text(Figure):
         self._text = text
         self.lines = []
         # Remove all sub-text elements
-        for element in self.root.findall('tspan'):
-            self.root.remove(element)
+        self.remove(*[e for e in self.children if e.node.tag == 'tspan'])
 
         first = True
         for line in text.split('\n'):
             span = Element('tspan')
-            span.root.text = line
+            span.node.text = line
             if first:
                 span.setAttributes({
                     'x': self.x,
@@ -562,7 +1593,7 @@ class Text(Figure):
             else:
                 span.setAttributes({
                     'x': self.x,
-                    'dy': str(self.lineHeight) + 'em'
+                    'dy': NumberData('{}em', (self.lineHeight,))
                 })
             self.add(span)
             self.lines.append(span)
@@ -580,6 +1611,10 @@ class Image(Figure):
             'href': href
         })
 
+    def bounds(self):
+        x, y = self.number('x'), self.number('y')
+        return (x, y, x + self.number('width'), y + self.number('height'))
+
 class Link(Element):
     def __init__(self, url, content=None):
         super().__init__('a')
@@ -615,7 +1650,7 @@ class FigureStyle(dict):
         return self
 
     def dashArray(self, *lengths):
-        self['stroke-dasharray'] = ' '.join(map(str, lengths))
+        self['stroke-dasharray'] = NumberData(' '.join(['{}'] * len(lengths)), lengths)
         return self
 
     def lineJoin(self, join):
@@ -0,0 +1,85 @@
+import os
+import io
+import sys
+import runpy
+import tempfile
+import unittest
+import contextlib
+import unittest.mock
+import xml.etree.ElementTree as ET
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+try:
+    from prosvg import render, canvas
+except (ImportError, OSError): # cairosvg, or the cairo library, is missing
+    render = None
+
+SAMPLING = 5 # Every Nth frame of the animations is compared
+
+# The cairo rasterizer draws the same pixels as cairosvg on the demo and the examples
+@unittest.skipIf(render is None, 'cairo is not available')
+class CanvasTest(unittest.TestCase):
+    def assertSamePixels(self, drawing, scale, name):
+        data = drawing.byteString()
+        expected = render.rasterize(data, scale, True)
+        for source, raster in (
+                ('elements', canvas.rasterize(drawing.node, scale, True, precision=drawing.precision)),
+                ('svg data', canvas.rasterize(ET.fromstring(data), scale, True))):
+            if raster != expected:
+                different = sum(a != b for a, b in zip(raster[::4], expected[::4]))
+                self.fail('{} from the {}: {} different pixels'.format(name, source, different))
+
+    # Runs a script, comparing its frames instead of rasterizing and encoding them
+    def runScript(self, script):
+        path = os.path.join(ROOT, script)
+        compared = []
+        def writeFrame(video, frames=1):
+            if video.frames % SAMPLING == 0:
+                self.assertSamePixels(video.scene, video.scale, '{} frame {}'.format(script, video.frames))
+                compared.append(video.frames)
+            video.frames += frames
+
+        directory = os.getcwd()
+        with tempfile.TemporaryDirectory() as output:
+            os.makedirs(os.path.join(output, 'demo')) # Used by demo-anim.py
+            os.chdir(output)
+            sys.path.insert(0, os.path.dirname(path))
+            try:
+                with unittest.mock.patch.object(render.Render, 'writeFrame', writeFrame), \
+                        unittest.mock.patch.object(render, 'FFMPEG_BIN', None), \
+                        contextlib.redirect_stdout(io.StringIO()):
+                    scope = runpy.run_path(path, run_name='__main__')
+            finally:
+                os.chdir(directory)
+                sys.path.pop(0)
+        return scope, compared
+
+    def test_demo_animation(self):
+        self.assertTrue(self.runScript('demo-anim.py')[1])
+
+    def test_circle_animation(self):
+        self.assertTrue(self.runScript('examples/circle-animation.py')[1])
+
+    def test_epicycloids(self):
+        scope, compared = self.runScript('examples/epicycloids.py')
+        self.assertTrue(compared)
+        self.assertSamePixels(scope['img'].scene, 1, 'epicycloids.svg')
+
+    def test_parametric_animation(self):
+        self.assertTrue(self.runScript('examples/parametric-animation.py')[1])
+
+    def test_text_animation(self):
+        self.assertTrue(self.runScript('examples/text-animation.py')[1])
+
+    # The demo image clones elements with <use>, which is left to cairosvg
+    def test_unsupported_features(self):
+        drawing = self.runScript('demo.py')[0]['img']
+        with self.assertRaises(canvas.Unsupported):
+            canvas.rasterize(drawing.node, 1)
+        data = drawing.byteString()
+        self.assertEqual(render.CairoRasterizer().rasterizeDrawing(drawing, 1, data=data), render.rasterize(data, 1))
+
+if __name__ == '__main__':
+    unittest.main()